@@ -0,0 +1,297 @@
+"""Benchmark suite for ripCleaner's scan / match / delete / log paths.
+
+Generates synthetic RIP folders and log folders, times each stage and
+writes machine-readable JSON. With --compare, results are checked against
+a saved baseline and the exit code is 1 when any stage regressed.
+
+Usage:
+    python benchmark.py                                  # 1k and 10k entries
+    python benchmark.py --sizes 1000,100000,1000000 --output bench.json
+    python benchmark.py --compare baseline.json --threshold 0.15
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import contextlib
+from collections import Counter
+from datetime import datetime, timedelta
+
+import ripCleaner
+
+STAGES = ("match", "scan_scandir", "scan_listdir", "delete_listdir", "delete_scandir",
+          "delete_async", "delete_readonly", "log_write", "cleanup", "retention")
+DEFAULT_SIZES = "1000,10000"
+DEFAULT_THRESHOLD = 0.15
+MATCHING_RATIO = 0.5
+EMPTY_RATIO = 0.05
+READONLY_RATIO = 0.05
+NON_MATCHING_NAMES = ("bip1-output-8bpp-{}.tif", "bip9-output-1bpp-{}.tif", "job-{}.spl",
+                      "bip2-output-1bpp-{}.tif.tmp", "preview-{}.png")
+
+def make_names(count, seed=0):
+    """Return (name, kind) pairs; kind is match / empty / readonly / other."""
+    rng = random.Random(seed)
+    names = []
+    for i in range(1, count + 1):
+        roll = rng.random()
+        if roll < MATCHING_RATIO:
+            kind = "match"
+            if roll < EMPTY_RATIO:
+                kind = "empty"
+            elif roll < EMPTY_RATIO + READONLY_RATIO:
+                kind = "readonly"
+            names.append((f"bip{rng.randint(0, 5)}-output-1bpp-{i}.tif", kind))
+        else:
+            names.append((rng.choice(NON_MATCHING_NAMES).format(i), "other"))
+    return names
+
+def populate_rip_folder(path, names):
+    os.makedirs(path, exist_ok=True)
+    for name, kind in names:
+        file_path = os.path.join(path, name)
+        with open(file_path, "wb") as f:
+            if kind != "empty":
+                f.write(b"\0" * 16)
+        if kind == "readonly":
+            os.chmod(file_path, 0o444)
+
+def protect_folder(path, protect=True):
+    """Make removes in path fail on POSIX, where a read-only file can still be deleted."""
+    if os.name != "nt":
+        os.chmod(path, 0o555 if protect else 0o755)
+
+def reset_folder(path):
+    if os.path.isdir(path):
+        protect_folder(path, False)
+    shutil.rmtree(path, ignore_errors=True)
+
+def populate_log_folder(path, count, days=60):
+    """Create count run logs spread over the last days, named like real ones."""
+    os.makedirs(path, exist_ok=True)
+    now = datetime.now()
+    for i in range(count):
+        stamp = now - timedelta(seconds=i * days * 86400 // max(count, 1))
+        name = f"{stamp.strftime(ripCleaner.LOG_DATETIME_FORMAT)}_{ripCleaner.VALID_RIPS[i % 3]}.log"
+        file_path = os.path.join(path, name)
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("Execution time: -\n")
+        ts = stamp.timestamp()
+        os.utime(file_path, (ts, ts))
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the cleaner's per-file console output while timing."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def time_call(func, setup=None, repeat=3):
+    """Run setup() (untimed) then func(prepared) repeat times; returns (seconds list, last result)."""
+    runs = []
+    result = None
+    for _ in range(repeat):
+        prepared = setup() if setup else None
+        started = time.perf_counter()
+        with quiet():
+            result = func(prepared)
+        runs.append(time.perf_counter() - started)
+    return runs, result
+
+def bench_size(size, workdir, repeat, stages):
+    names = make_names(size)
+    results = {}
+
+    def record(stage, runs, items, io_counts=None):
+        seconds = statistics.median(runs)
+        entry = {
+            "size": size,
+            "seconds": seconds,
+            "runs": runs,
+            "per_item_us": seconds / max(items, 1) * 1e6,
+        }
+        if io_counts is not None:
+            entry["io"] = dict(io_counts)
+        results[f"{stage}@{size}"] = entry
+        print(f"  {stage:<15} {size:>9} entries  {seconds * 1000:10.1f} ms")
+
+    if "match" in stages:
+        plain = [name for name, _kind in names]
+        policy = ripCleaner.DEFAULT_POLICY
+        runs, _ = time_call(lambda _: sum(1 for n in plain if policy.match(n)), repeat=repeat)
+        record("match", runs, size)
+
+    scan_dir = os.path.join(workdir, f"scan_{size}")
+    if {"scan_scandir", "scan_listdir"} & set(stages):
+        populate_rip_folder(scan_dir, names)
+    for engine in ("scandir", "listdir"):
+        stage = f"scan_{engine}"
+        if stage not in stages:
+            continue
+
+        def scan(_, engine=engine):
+            io_counts = Counter()
+            for entry in ripCleaner.iter_matching_entries(scan_dir, io_counts, engine):
+                ripCleaner.get_entry_stat(entry, io_counts)
+            return io_counts
+
+        runs, io_counts = time_call(scan, repeat=repeat)
+        record(stage, runs, size, io_counts)
+
+    # Files that cannot be deleted are timed on their own (delete_readonly);
+    # with a retry queue they are tried once and deferred, as in the service.
+    log_dir = os.path.join(workdir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    writable = [(name, kind) for name, kind in names if kind != "readonly"]
+    readonly = [(name, kind) for name, kind in names if kind == "readonly"]
+    for stage in ("delete_listdir", "delete_scandir", "delete_async", "delete_readonly"):
+        if stage not in stages:
+            continue
+        rip_dir = os.path.join(workdir, f"{stage}_{size}")
+        files = readonly if stage == "delete_readonly" else writable
+
+        def setup(rip_dir=rip_dir, files=files, protect=stage == "delete_readonly"):
+            reset_folder(rip_dir)
+            populate_rip_folder(rip_dir, files)
+            if protect:
+                protect_folder(rip_dir)
+            return rip_dir, ripCleaner.RetryQueue()
+
+        if stage == "delete_async":
+            def run(prepared):
+                path, retry_queue = prepared
+                return ripCleaner.async_clean_once("BENCH", path, log_dir, retry_queue=retry_queue)
+        else:
+            engine = "scandir" if stage == "delete_readonly" else stage.split("_")[1]
+
+            def run(prepared, engine=engine):
+                path, retry_queue = prepared
+                return ripCleaner.delete_matching_files("BENCH", path, log_dir, engine,
+                                                        retry_queue=retry_queue)
+
+        try:
+            runs, _ = time_call(run, setup, repeat)
+        finally:
+            reset_folder(rip_dir)
+        record(stage, runs, len(files))
+
+    if "log_write" in stages:
+        deleted = [name for name, kind in names if kind == "match"]
+        skipped = [(name, "Empty file") for name, kind in names if kind == "empty"]
+        log_path = os.path.join(workdir, "bench_write.log")
+
+        def write_log(_):
+            ripCleaner.write_detailed_log(log_path, deleted, skipped)
+            ripCleaner.get_log_pipeline().flush()   # include the background write
+
+        runs, _ = time_call(write_log, repeat=repeat)
+        record("log_write", runs, len(deleted) + len(skipped))
+
+    if "cleanup" in stages:
+        cleanup_dir = os.path.join(workdir, f"cleanup_{size}")
+
+        def setup_logs():
+            shutil.rmtree(cleanup_dir, ignore_errors=True)
+            populate_log_folder(cleanup_dir, size)
+
+        runs, _ = time_call(lambda _: ripCleaner.cleanup_old_logs(cleanup_dir), setup_logs, repeat)
+        record("cleanup", runs, size)
+
+    if "retention" in stages:
+        retention_dir = os.path.join(workdir, f"retention_{size}")
+
+        def setup_index():
+            # Build the index first; the timed pass only handles the expired half.
+            shutil.rmtree(retention_dir, ignore_errors=True)
+            populate_log_folder(retention_dir, size)
+            retention = ripCleaner.LogRetention(retention_dir)
+            retention.run_once(datetime.now() - timedelta(days=60))
+            return retention
+
+        runs, _ = time_call(lambda retention: retention.run_once(), setup_index, repeat)
+        record("retention", runs, size)
+
+    return results
+
+def compare(results, baseline, threshold):
+    """Print a comparison table; returns the list of regressed keys."""
+    regressions = []
+    print(f"\n{'stage':<26} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        before = baseline[key]["seconds"]
+        after = results[key]["seconds"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:<26} {before * 1000:12.1f} {after * 1000:12.1f} {change:+8.1%}{flag}")
+    return regressions
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark ripCleaner stages.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"comma-separated entry counts (default: {DEFAULT_SIZES})")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help="comma-separated stages to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the median is kept")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against a saved JSON result")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed slowdown before flagging a regression (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--workdir", help="directory for synthetic data (default: a temp dir)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        print(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+        return 2
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ripcleaner-bench-")
+    results = {}
+    try:
+        for size in sizes:
+            print(f"Benchmarking {size} entries in {workdir}")
+            results.update(bench_size(size, os.path.join(workdir, str(size)), args.repeat, stages))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    document = {
+        "meta": {
+            "version": ripCleaner.VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now().strftime(ripCleaner.DETAILED_DATETIME_FORMAT),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed by more than {args.threshold:.0%}.")
+            return 1
+        print("No regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,36 @@
 ﻿import os
 import re
+import asyncio
 import sys
 import time
+import random
+import select
+import signal
+import struct
+import array
+import heapq
+import bisect
+import gzip
+import json
+import sqlite3
+import argparse
+import secrets
+import urllib.error
+import urllib.request
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import shutil
+import queue
+import atexit
+import tempfile
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 import configparser
-from datetime import datetime
+from collections import Counter, deque, namedtuple
+from types import MappingProxyType
+from datetime import datetime, timedelta
 import ctypes
 from ctypes import wintypes
 
@@ -12,10 +39,86 @@ APP_NAME = "ripCleaner"          # <-- set your new app name here
 VERSION = "0.5"
 VALID_RIPS = ["RIP1", "RIP2", "RIP3"]
 DEFAULT_POLLING_INTERVAL = 5.0
+DEFAULT_MIN_POLLING_INTERVAL = 0.5  # minutes; bounds of the adaptive polling interval
+DEFAULT_MAX_POLLING_INTERVAL = 30.0
+ADAPTIVE_TARGET_FILES = 50          # new files per tick the adaptive interval aims at
+ADAPTIVE_STEP = 2.0                 # largest change of the interval per tick (factor)
+ADAPTIVE_SMOOTHING = 0.5            # weight of the latest tick in the arrival rate
+OVERRUN_POLICIES = ("skip", "catch_up", "coalesce")
+DEFAULT_OVERRUN_POLICY = "skip"
+CATCH_UP_MAX_SLOTS = 3              # missed slots run back to back at most (catch_up)
+CONFIG_WATCH_INTERVAL = 2.0         # seconds between checks of config.ini for changes
+DEFAULT_DRAIN_TIMEOUT = 60.0        # seconds running work may take to finish after a stop signal
+SHUTDOWN_POLL_INTERVAL = 1.0        # longest idle wait before a stop request is noticed
+EXIT_DRAIN_TIMEOUT = 3              # exit status when work was still running at the drain deadline
+INSTANCE_LOCK_FILE = f"{APP_NAME}.lock"      # next to the executable
+CONTROL_FILE = f"{APP_NAME}.control"         # port and token of the running instance's control channel
+CONTROL_ADDRESS = "127.0.0.1"
+KICK_TIMEOUT = 600.0                # seconds a --kick client waits for the running instance
+KICK_POLL_INTERVAL = 0.2            # asyncio engine: seconds between checks for kicks
+DEFAULT_FREE_SPACE_INTERVAL = 10.0  # seconds between free space checks of each target's volume
+DEFAULT_EMERGENCY_CONCURRENCY = 16  # parallel deletions during a low free space cleanup
+FREE_SPACE_RETRIGGER = 60.0         # seconds before another cleanup while space is still low
+# [General] keys only read at start-up; a reload reports that they need a restart
+RESTART_SETTINGS = ("engine", "target_workers", "async_concurrency", "startup_jitter",
+                    "log_dir", "log_spool_dir", "log_retention_days",
+                    "log_retention_interval", "log_compress_after", "log_day_buckets",
+                    "event_log", "log_index", "metrics_port", "metrics_address",
+                    "metrics_textfile", "watch_debounce", "watch_rescan_interval",
+                    "drain_timeout", "control", "control_port")
 RETRY_MAX_ATTEMPTS = 3
 RETRY_DELAY_SECONDS = 1
 LOG_DATETIME_FORMAT = "%Y%m%d_%H%M%S"
 DETAILED_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+SCAN_ENGINES = ("scandir", "listdir")
+DEFAULT_SCAN_ENGINE = "scandir"
+DEFAULT_FULL_SCAN_INTERVAL = 60.0   # minutes
+DEFAULT_WATCH_DEBOUNCE = 0.5        # seconds
+DEFAULT_WATCH_RESCAN_INTERVAL = 10.0  # minutes
+WATCH_MAX_DELAY = 5.0               # seconds; flush even while events keep arriving
+DEFAULT_TARGET_WORKERS = len(VALID_RIPS)
+ENGINES = ("threads", "asyncio")
+DEFAULT_ENGINE = "threads"
+DEFAULT_ASYNC_CONCURRENCY = 8       # in-flight file operations per target (asyncio engine)
+SCAN_BATCH = 256                    # entries pulled from a listing per guarded/executor call
+DEFAULT_FS_TIMEOUT = 10.0           # seconds per filesystem call against a target (0 = no limit)
+FS_GUARD_WORKERS = 4
+DEFAULT_DELETE_CONCURRENCY = 4      # parallel per-file deletions within one folder
+DEFAULT_RETRY_MAX_BACKOFF = 3600.0  # seconds; cap for the per-file retry delay of locked files
+DEFAULT_BREAKER_THRESHOLD = 3       # consecutive failures before the circuit opens
+DEFAULT_BREAKER_BACKOFF = 30.0      # seconds; doubles on each failed probe
+DEFAULT_BREAKER_MAX_BACKOFF = 900.0
+LOG_FLUSH_RECORDS = 256             # run log records buffered before a flush
+LOG_FLUSH_SECONDS = 1.0
+LOG_SPILL_MEMORY = 64 * 1024        # bytes of skipped records kept in memory before spilling to disk
+LOG_MODES = ("per_run", "daily")
+DEFAULT_LOG_MODE = "per_run"
+DAILY_LOG_DATE_FORMAT = "%Y%m%d"
+DEFAULT_LOG_SPOOL_DIR = "log_spool"  # relative to the executable
+LOG_QUEUE_CHUNKS = 256              # queued log chunks before writers wait for the log pipeline
+LOG_GROUP_COMMIT = 64               # chunks written per batch by the log pipeline
+LOG_REPLAY_INTERVAL = 5.0           # seconds between attempts to replay the local spool
+LOG_SHUTDOWN_TIMEOUT = 10.0
+DEFAULT_LOG_RETENTION_DAYS = 30
+DEFAULT_LOG_RETENTION_INTERVAL = 60.0  # minutes between retention passes
+LOG_RETENTION_RESCAN = 24 * 3600.0     # seconds; full relisting of log_dir to pick up outside changes
+EVENT_LOG_SUFFIX = ".events.jsonl"
+DEFAULT_LOG_INDEX = "log_index.sqlite"  # relative to the executable
+LOG_INDEX_SETTLE = 60.0                # seconds; the last run of a log modified this recently is not indexed yet
+LOG_INDEX_POOL_MIN = 16                # parse in a process pool from this many new/changed logs
+DEFAULT_METRICS_ADDRESS = "127.0.0.1"
+METRICS_TEXTFILE_INTERVAL = 15.0       # seconds between textfile collector writes
+CONSOLE_LEVELS = ("silent", "error", "warning", "summary", "info", "files")
+DEFAULT_CONSOLE_LEVEL = "summary"
+LEVEL_ERROR, LEVEL_WARNING, LEVEL_SUMMARY, LEVEL_INFO, LEVEL_FILES = range(1, 6)
+CONSOLE_FILE_RATE = 20.0            # per-file console lines per second and target
+CONSOLE_FILE_BURST = 100
+TREND_FILE = f"{APP_NAME}_trend.dat"   # in log_dir
+TREND_FIELDS = ("time", "ticks", "deleted", "skipped", "bytes", "duration", "backlog")
+TREND_RINGS = (("tick", 1440, None), ("hour", 24 * 14, "hour"), ("day", 400, "day"))  # name, slots, rollup
+IO_OPS = ("listdir", "scandir", "stat", "remove")   # calls against the share
+TICK_PHASES = ("list", "stat", "delete", "retry_wait", "log")
+METRIC_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
 
 try:
     import win32file
@@ -24,10 +127,934 @@ except Exception:
     win32file = None
     win32con = None
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+# bip<0-5>-output-1bpp-<ページ番号>.tif
+TIFF_PATTERN = r"bip([0-5])-output-1bpp-([1-9][0-9]*)\.tif"
+_TIFF_REGEX = re.compile(TIFF_PATTERN, re.IGNORECASE)
+RULE_SECTION_PREFIX = "rule:"
+RULE_ACTIONS = ("delete", "ignore")
+
 def is_valid_tiff(filename):
     # bip<0-5>-output-1bpp-<ページ番号>.tif にマッチするか
-    pattern = r"^bip([0-5])-output-1bpp-([1-9][0-9]*)\.tif$"
-    return re.match(pattern, filename, re.IGNORECASE)
+    return _TIFF_REGEX.fullmatch(filename)
+
+class PolicyRule:
+    """One file rule: what to do with names matching its pattern."""
+    __slots__ = ("name", "pattern", "action", "min_size", "min_age", "extension", "prefix")
+
+    def __init__(self, name, pattern, action="delete", min_size=1, min_age=0.0,
+                 extension="", prefix=""):
+        self.name = name
+        self.pattern = pattern
+        self.action = action          # delete / ignore
+        self.min_size = min_size      # bytes; smaller files are skipped ("Empty file" when 0 bytes)
+        self.min_age = min_age        # seconds since last modification
+        self.extension = extension.lower()
+        self.prefix = prefix.lower()
+
+_PLAIN_FLAGS = re.compile("").flags   # インラインフラグのないパターンのフラグ
+_GROUP_REFERENCE = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]|\(\?\(")
+
+def _joinable(compiled):
+    """True if compiled.pattern keeps its meaning inside the combined alternation."""
+    return (compiled.flags == _PLAIN_FLAGS and not compiled.groupindex
+            and not _GROUP_REFERENCE.search(compiled.pattern))
+
+BUILTIN_RULE = PolicyRule("builtin", TIFF_PATTERN, extension=".tif", prefix="bip")
+
+class Policy:
+    """Rules for one target compiled into a single matcher plus a decision table.
+
+    A cheap extension/prefix check rejects most names before the combined
+    regex runs; the first rule (in configuration order) whose pattern
+    matches decides the action. Patterns that cannot be joined safely
+    (backreferences, whose group numbers would shift, named groups, which
+    can clash, and inline global flags) make the policy match rule by rule
+    instead.
+    Raises ValueError naming the rule whose pattern does not compile.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._decisions = [(f"r{i}", rule if rule.action == "delete" else None)
+                           for i, rule in enumerate(self.rules)]
+        compiled = []
+        for rule in self.rules:
+            try:
+                compiled.append(re.compile(rule.pattern))
+            except re.error as e:
+                raise ValueError(f"Invalid pattern in rule '{rule.name}': {e}")
+        self._regex = None
+        if all(_joinable(c) for c in compiled):
+            try:
+                self._regex = re.compile(
+                    "|".join(f"(?P<r{i}>{rule.pattern})" for i, rule in enumerate(self.rules)),
+                    re.IGNORECASE)
+            except re.error:
+                pass
+        # 結合できないときはルールごとの正規表現を順に試す
+        self._per_rule = None if self._regex is not None else [
+            (re.compile(rule.pattern, re.IGNORECASE), decision)
+            for rule, (_group, decision) in zip(self.rules, self._decisions)]
+        self._extensions = None
+        self._prefixes = None
+        # 全ルールに拡張子／接頭辞の指定がある場合だけ事前判定に使える
+        if all(rule.extension for rule in self.rules):
+            self._extensions = tuple({rule.extension for rule in self.rules})
+        if all(rule.prefix for rule in self.rules):
+            self._prefixes = tuple({rule.prefix for rule in self.rules})
+
+    def match(self, name):
+        """Return the delete rule that applies to name, or None."""
+        if self._extensions is not None or self._prefixes is not None:
+            lower = name.lower()
+            if self._extensions is not None and not lower.endswith(self._extensions):
+                return None
+            if self._prefixes is not None and not lower.startswith(self._prefixes):
+                return None
+        if self._per_rule is not None:
+            for regex, rule in self._per_rule:
+                if regex.fullmatch(name):
+                    return rule
+            return None
+        match = self._regex.fullmatch(name)
+        if match is None:
+            return None
+        for group, rule in self._decisions:
+            if match.start(group) >= 0:
+                return rule
+        return None
+
+DEFAULT_POLICY = Policy([BUILTIN_RULE])
+
+def _parse_rule(section, rule_name):
+    pattern = section.get("pattern", "")
+    if not pattern:
+        raise ValueError(f"'pattern' is required in {section.name}")
+    try:
+        re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Invalid pattern in {section.name}: {e}")
+    action = section.get("action", "delete")
+    if action not in RULE_ACTIONS:
+        raise ValueError(f"action must be one of: {', '.join(RULE_ACTIONS)} in {section.name}")
+    min_size = section.getint("min_size", fallback=1)
+    min_age = section.getfloat("min_age", fallback=0.0)
+    if min_size < 0 or min_age < 0:
+        raise ValueError(f"min_size and min_age must not be negative in {section.name}")
+    return PolicyRule(rule_name, pattern, action, min_size, min_age,
+                      section.get("extension", ""), section.get("prefix", ""))
+
+def compile_policy(config, rip_name):
+    """Build the Policy for rip_name from the [rule:<name>] sections of config.
+
+    Rules apply to the RIPs listed in their 'targets' key (default: all) in
+    file order. The built-in bip*-output-1bpp-*.tif rule is appended unless
+    builtin_rule = false in [General].
+    """
+    rules = []
+    for section_name in config.sections():
+        if not section_name.startswith(RULE_SECTION_PREFIX):
+            continue
+        section = config[section_name]
+        targets = [t.strip() for t in section.get("targets", "").split(",") if t.strip()]
+        if targets and rip_name not in targets:
+            continue
+        rules.append(_parse_rule(section, section_name[len(RULE_SECTION_PREFIX):]))
+    if config["General"].getboolean("builtin_rule", fallback=True):
+        rules.append(BUILTIN_RULE)
+    if not rules:
+        raise ValueError(f"No file rules apply to {rip_name}")
+    return Policy(rules)
+
+class MatchedEntry:
+    """A scan entry together with the policy rule that matched its name."""
+    __slots__ = ("entry", "rule")
+
+    def __init__(self, entry, rule):
+        self.entry = entry
+        self.rule = rule
+
+    @property
+    def name(self):
+        return self.entry.name
+
+    @property
+    def path(self):
+        return self.entry.path
+
+class _ListdirEntry:
+    """Minimal DirEntry stand-in for the legacy listdir scan (one stat per call)."""
+    __slots__ = ("name", "path", "_io_counts")
+
+    def __init__(self, dir_path, name, io_counts):
+        self.name = name
+        self.path = os.path.join(dir_path, name)
+        self._io_counts = io_counts
+
+    def stat(self, follow_symlinks=True):
+        self._io_counts["stat"] += 1
+        return os.stat(self.path, follow_symlinks=follow_symlinks)
+
+def _filter_matching(entries, policy, ignored=None, io_counts=None):
+    match = policy.match
+    for entry in entries:
+        if io_counts is not None:
+            io_counts["entries"] += 1   # 列挙件数（メトリクス用、I/O 回数ではない）
+        name = entry.name
+        if ignored is not None and name in ignored:
+            continue
+        rule = match(name)
+        if rule is not None:
+            yield MatchedEntry(entry, rule)
+        elif ignored is not None:
+            ignored.add(name)
+
+def _iter_scandir(scan_iter, policy, ignored, io_counts=None):
+    with scan_iter:
+        yield from _filter_matching(scan_iter, policy, ignored, io_counts)
+
+def iter_matching_entries(path, io_counts, engine=DEFAULT_SCAN_ENGINE, ignored=None,
+                          policy=DEFAULT_POLICY):
+    """Open path and lazily yield a MatchedEntry for every name policy selects.
+
+    The directory is opened immediately so access errors reach the caller.
+    io_counts (a Counter) is incremented for every metadata call made.
+    Names in ignored are skipped without classification; non-matching names
+    are added to it.
+    """
+    if engine == "listdir":
+        io_counts["listdir"] += 1
+        names = os.listdir(path)
+        return _filter_matching((_ListdirEntry(path, name, io_counts) for name in names),
+                                policy, ignored, io_counts)
+    io_counts["scandir"] += 1
+    return _iter_scandir(os.scandir(path), policy, ignored, io_counts)
+
+def match_names(path, names, io_counts, policy=DEFAULT_POLICY):
+    """Return MatchedEntry objects for the given names without listing path (one stat each later)."""
+    entries = []
+    for name in sorted(names):
+        rule = policy.match(name)
+        if rule is not None:
+            entries.append(MatchedEntry(_ListdirEntry(path, name, io_counts), rule))
+    return entries
+
+class DirectorySnapshot:
+    """Folder metadata and known entry names from the previous scan of one RIP path."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.dir_key = None          # (st_dev, st_ino, st_mtime_ns) of the folder itself
+        self.ignored = set()         # 対象外と判定済みのファイル名
+        self.pending = set()         # 対象だが未削除のファイル名（空・使用中・削除失敗）
+        self.last_full_scan = None   # time.monotonic() of the last full reconciliation
+
+    def reset(self, path):
+        self.__init__(path)
+
+    def invalidate(self):
+        """Force a listing on the next tick (e.g. after an access error)."""
+        self.dir_key = None
+
+def iter_snapshot_entries(path, io_counts, snapshot, engine=DEFAULT_SCAN_ENGINE,
+                          full_scan_interval=DEFAULT_FULL_SCAN_INTERVAL, policy=DEFAULT_POLICY):
+    """Return (entries, listed) for this tick, using snapshot to avoid needless listings.
+
+    If the folder's own metadata is unchanged, nothing is listed and only the
+    pending names from earlier ticks are returned. Otherwise the folder is
+    listed and names already known to be out of scope are not classified again.
+    Every full_scan_interval minutes the snapshot is discarded and rebuilt.
+    The caller re-adds names it did not delete to snapshot.pending.
+    """
+    if snapshot.path != path:
+        snapshot.reset(path)
+    io_counts["stat"] += 1
+    st = os.stat(path)
+    dir_key = (st.st_dev, st.st_ino, st.st_mtime_ns)
+    now = time.monotonic()
+    if snapshot.last_full_scan is None or now - snapshot.last_full_scan >= full_scan_interval * 60:
+        snapshot.reset(path)
+        snapshot.last_full_scan = now
+    elif dir_key == snapshot.dir_key:
+        pending = match_names(path, snapshot.pending, io_counts, policy)
+        snapshot.pending.clear()
+        return pending, False
+
+    entries = iter_matching_entries(path, io_counts, engine, snapshot.ignored, policy)
+    # 一覧取得前の状態を記録する（取得中に追加されたファイルは次回の変更として検出される）
+    snapshot.dir_key = dir_key
+    snapshot.pending.clear()
+    return entries, True
+
+def get_entry_stat(entry, io_counts):
+    """Return the stat result for a scan entry, counting a stat call only when one is made."""
+    if isinstance(entry, MatchedEntry):
+        entry = entry.entry
+    if isinstance(entry, os.DirEntry):
+        # Windows では scandir の結果に stat 情報が含まれるため追加の通信は発生しない
+        if os.name != "nt":
+            io_counts["stat"] += 1
+        return entry.stat(follow_symlinks=False)
+    return entry.stat()
+
+def format_io_counts(io_counts):
+    return " ".join(f"{op}={io_counts[op]}" for op in sorted(IO_OPS) if io_counts[op]) or "none"
+
+def timed(iterable, timings, phase):
+    """Yield from iterable, adding the time spent waiting for each item to timings[phase]."""
+    iterator = iter(iterable)
+    while True:
+        started = time.monotonic()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            timings[phase] += time.monotonic() - started
+            return
+        timings[phase] += time.monotonic() - started
+        yield item
+
+def format_tick_summary(io_counts, timings, scan_engine, elapsed):
+    """Lines of the run log's summary block: phase times and file system calls by type."""
+    phases = " ".join(f"{phase}={timings[phase]:.3f}s" for phase in TICK_PHASES)
+    ops = " ".join(f"{op}={io_counts[op]}" for op in IO_OPS)
+    return [f"Duration: {elapsed:.3f}s",
+            f"Phase times (summed over worker threads): {phases}",
+            f"File system calls ({scan_engine}): {ops}",
+            f"Entries listed: {io_counts['entries']}"]
+
+def iter_named_entries(path, names, io_counts, snapshot=None, policy=DEFAULT_POLICY):
+    """Return entries for the given names (plus pending ones) without listing path."""
+    candidates = set(names)
+    if snapshot is not None:
+        candidates |= snapshot.pending
+        snapshot.pending.clear()
+    return match_names(path, candidates, io_counts, policy)
+
+class TickResult:
+    """Outcome of one cleaning pass for one target."""
+    __slots__ = ("rip_name", "status", "deleted", "skipped", "duration", "reclaimed")
+
+    def __init__(self, rip_name, status, deleted=0, skipped=0, duration=0.0, reclaimed=0):
+        self.rip_name = rip_name
+        self.status = status        # ok / disabled / missing / access_error / circuit_open / busy / error / stopped
+        self.deleted = deleted
+        self.skipped = skipped
+        self.duration = duration
+        self.reclaimed = reclaimed  # bytes
+
+    def __repr__(self):
+        return (f"TickResult({self.rip_name}, {self.status}, deleted={self.deleted}, "
+                f"skipped={self.skipped}, duration={self.duration:.2f}s)")
+
+class Console:
+    """Leveled console output.
+
+    level is an index into CONSOLE_LEVELS: silent prints nothing, summary
+    (the default) prints start-up, per-tick and per-target summaries plus
+    warnings and errors, files adds one line per file. Per-file lines are
+    rate limited per target (CONSOLE_FILE_RATE lines/s, bursts of
+    CONSOLE_FILE_BURST); what is dropped is reported as one "N more"
+    line. The run logs always have every file.
+    """
+
+    def __init__(self, level=CONSOLE_LEVELS.index(DEFAULT_CONSOLE_LEVEL)):
+        self.level = level
+        self._lock = threading.Lock()
+        self._buckets = {}      # target -> (tokens, last refill)
+        self._suppressed = Counter()
+
+    def _print(self, level, message):
+        if level <= self.level:
+            print(message)
+
+    def error(self, message):
+        self._print(LEVEL_ERROR, message)
+
+    def warning(self, message):
+        self._print(LEVEL_WARNING, message)
+
+    def summary(self, message):
+        self._print(LEVEL_SUMMARY, message)
+
+    def info(self, message):
+        self._print(LEVEL_INFO, message)
+
+    def file(self, rip_name, message, level=LEVEL_FILES):
+        """Per-file line for rip_name, subject to the rate limit."""
+        if level > self.level:
+            return
+        with self._lock:
+            now = time.monotonic()
+            tokens, refilled = self._buckets.get(rip_name, (CONSOLE_FILE_BURST, now))
+            tokens = min(CONSOLE_FILE_BURST, tokens + (now - refilled) * CONSOLE_FILE_RATE)
+            if tokens < 1:
+                self._buckets[rip_name] = (tokens, now)
+                self._suppressed[rip_name] += 1
+                return
+            self._buckets[rip_name] = (tokens - 1, now)
+            suppressed = self._suppressed.pop(rip_name, 0)
+        if suppressed:
+            print(f"[{rip_name}] ... {suppressed} more file message(s) suppressed.")
+        print(f"[{rip_name}] {message}")
+
+    def rollup(self, rip_name):
+        """Report per-file lines dropped for rip_name (end of its tick)."""
+        with self._lock:
+            suppressed = self._suppressed.pop(rip_name, 0)
+        if suppressed:
+            print(f"[{rip_name}] ... {suppressed} more file message(s) suppressed; see the run log.")
+
+console = Console()
+
+class Shutdown:
+    """SIGINT / SIGTERM handling for the running modes.
+
+    The first signal sets requested: no new ticks start and running ticks
+    stop taking new files, finish the ones in flight and write their logs.
+    If that takes longer than drain_timeout seconds, or a second signal
+    arrives, buffered state is flushed and the process exits at once with
+    EXIT_DRAIN_TIMEOUT.
+    """
+
+    def __init__(self):
+        self.requested = threading.Event()
+        self.drain_timeout = DEFAULT_DRAIN_TIMEOUT
+
+    def install(self, drain_timeout=DEFAULT_DRAIN_TIMEOUT):
+        self.drain_timeout = drain_timeout
+        for name in ("SIGINT", "SIGTERM", "SIGBREAK"):   # SIGBREAK: Ctrl+Break (Windows)
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), self._handle)
+
+    def _handle(self, signum, frame):
+        name = signal.Signals(signum).name
+        if self.requested.is_set():
+            console.warning(f"{name} received again; exiting without waiting for running work.")
+            self.exit_now()
+        self.requested.set()
+        console.summary(f"{name} received; finishing running work (up to {self.drain_timeout:g}s).")
+        timer = threading.Timer(self.drain_timeout, self._expired)
+        timer.daemon = True
+        timer.start()
+
+    def _expired(self):
+        console.error(f"Work still running after {self.drain_timeout:g}s; exiting.")
+        self.exit_now()
+
+    def exit_now(self):
+        flush_state()
+        os._exit(EXIT_DRAIN_TIMEOUT)   # 応答しない共有上の呼び出しを待たずに終了する
+
+shutdown = Shutdown()
+
+class StopOnShutdown:
+    """Iterator over entries that ends early once a shutdown is requested."""
+
+    def __init__(self, entries):
+        self._entries = iter(entries)
+        self.stopped = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if shutdown.requested.is_set():
+            self.stopped = True
+            raise StopIteration
+        return next(self._entries)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout."""
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(METRIC_BUCKETS) + 1)   # last slot = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(METRIC_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+# name -> (type, help); counters are exported with a _total suffix
+METRIC_DEFS = {
+    "files_enumerated": ("counter", "Directory entries listed"),
+    "files_matched": ("counter", "Entries selected by the file rules and checked"),
+    "files_deleted": ("counter", "Files deleted"),
+    "files_skipped": ("counter", "Files skipped, by reason"),
+    "retries": ("counter", "Delete attempts repeated because the file was locked"),
+    "bytes_reclaimed": ("counter", "Bytes freed by deleted files"),
+    "ticks": ("counter", "Cleaning passes, by status"),
+    "ticks_overrun": ("counter", "Polling ticks that ended after their next slot had begun, by policy"),
+    "backlog_files": ("gauge", "Matched files left over for a later pass"),
+    "free_bytes": ("gauge", "Free space on the target's volume"),
+    "free_space_cleanups": ("counter", "Cleanups started because free space was low"),
+    "polling_interval_seconds": ("gauge", "Current polling interval"),
+    "tick_duration_seconds": ("histogram", "Duration of one cleaning pass"),
+    "enumeration_seconds": ("histogram", "Time spent listing the folder in a tick"),
+    "delete_seconds": ("histogram", "Duration of one file delete"),
+}
+
+class Metrics:
+    """Cheap in-process counters, gauges and histograms per target.
+
+    Updated where the work happens and read by the metrics endpoint and the
+    textfile collector; nothing is derived from the logs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}   # (name, target, label) -> number or Histogram
+
+    def inc(self, name, target, value=1, label=None):
+        key = (name, target, label)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, target, value):
+        with self._lock:
+            self._values[(name, target, None)] = value
+
+    def observe(self, name, target, seconds):
+        key = (name, target, None)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = Histogram()
+            histogram.observe(seconds)
+
+    def _items(self):
+        with self._lock:
+            return sorted((key, value if isinstance(value, (int, float)) else
+                           (list(value.counts), value.sum, value.count))
+                          for key, value in self._values.items())
+
+    def render_prometheus(self):
+        """Prometheus text exposition format."""
+        lines = []
+        described = set()
+        label_names = {"files_skipped": "reason", "ticks": "status"}
+        for (name, target, label), value in self._items():
+            kind, help_text = METRIC_DEFS[name]
+            full = f"{APP_NAME.lower()}_{name}" + ("_total" if kind == "counter" else "")
+            if full not in described:
+                described.add(full)
+                lines.append(f"# HELP {full} {help_text}")
+                lines.append(f"# TYPE {full} {kind}")
+            labels = f'target="{target}"'
+            if label is not None:
+                escaped = str(label).replace("\\", "\\\\").replace('"', '\\"')
+                labels += f',{label_names[name]}="{escaped}"'
+            if kind != "histogram":
+                lines.append(f"{full}{{{labels}}} {value:g}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(METRIC_BUCKETS + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{full}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{full}_sum{{{labels}}} {total:g}")
+            lines.append(f"{full}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def as_dict(self):
+        """{target: {metric: value}}; labelled metrics and histograms as nested dicts."""
+        result = {}
+        for (name, target, label), value in self._items():
+            metrics_for = result.setdefault(target, {})
+            if isinstance(value, tuple):
+                counts, total, count = value
+                value = {"count": count, "sum": total,
+                         "buckets": {f"{bound:g}": n for bound, n in
+                                     zip(METRIC_BUCKETS + (float("inf"),), counts)}}
+            if label is not None:
+                metrics_for.setdefault(name, {})[label] = value
+            else:
+                metrics_for[name] = value
+        return result
+
+metrics = Metrics()
+
+def skip_reason_label(reason):
+    """Low-cardinality label for a skip reason ("Too small: 3 bytes" -> "Too small")."""
+    return reason.split(":", 1)[0].split(" (", 1)[0]
+
+def _take_batch(entries, size):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= size:
+            break
+    return batch
+
+class CallGuard:
+    """Runs blocking filesystem calls against one target under a deadline.
+
+    Calls run on a small private pool so a hung share only ties up its own
+    threads. A timeout of 0 disables the deadline and calls run inline.
+    The same pool runs up to concurrency per-file operations in parallel
+    (see run_each).
+    """
+
+    def __init__(self, rip_name, timeout=DEFAULT_FS_TIMEOUT, workers=FS_GUARD_WORKERS, concurrency=1):
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self._executor = None
+        if timeout > 0 or concurrency > 1:
+            self._executor = ThreadPoolExecutor(max_workers=workers + concurrency,
+                                                thread_name_prefix=f"fs-{rip_name}")
+
+    def shutdown(self):
+        """Release the pool; calls still hanging on the share are abandoned."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _result(self, future, func, limit):
+        try:
+            return future.result(timeout=limit)
+        except FuturesTimeoutError:
+            # 応答しない呼び出しはスレッドごと放置し、呼び出し側には即座に失敗を返す
+            raise TimeoutError(f"{func.__name__} did not finish within {limit:g}s") from None
+
+    def call(self, func, *args, timeout=None):
+        """Return func(*args); raises TimeoutError if it does not finish in time."""
+        if self.timeout <= 0:
+            return func(*args)
+        limit = timeout or self.timeout
+        return self._result(self._executor.submit(func, *args), func, limit)
+
+    def iter(self, entries):
+        """Yield entries from a listing, fetching each batch under the deadline."""
+        if self.timeout <= 0:
+            yield from entries
+            return
+        entries = iter(entries)
+        while True:
+            batch = self.call(_take_batch, entries, SCAN_BATCH)
+            if not batch:
+                return
+            yield from batch
+
+    def run_each(self, func, items, timeout=None):
+        """Yield (item, func(item)) in order, keeping up to concurrency calls in flight.
+
+        Each call must finish within timeout of being submitted; otherwise
+        TimeoutError is raised and no further items are submitted. Calls
+        that already finished by then are still yielded first; only those
+        still running are abandoned.
+        """
+        if self.concurrency <= 1:
+            for item in items:
+                yield item, self.call(func, item, timeout=timeout)
+            return
+        limit = (timeout or self.timeout) if self.timeout > 0 else None
+        items = iter(items)
+        inflight = deque()
+        while True:
+            while len(inflight) < self.concurrency:
+                item = next(items, None)
+                if item is None:
+                    break
+                deadline = time.monotonic() + limit if limit else None
+                inflight.append((item, self._executor.submit(func, item), deadline))
+            if not inflight:
+                return
+            item, future, deadline = inflight.popleft()
+            remaining = max(0.0, deadline - time.monotonic()) if deadline else None
+            try:
+                result = self._result(future, func, remaining)
+            except TimeoutError:
+                # 完了済みの呼び出し（削除済みのファイルなど）は結果を捨てずに返す
+                finished = []
+                for pending_item, pending, _deadline in inflight:
+                    if not pending.cancel() and pending.done() and pending.exception() is None:
+                        finished.append((pending_item, pending.result()))
+                yield from finished
+                raise TimeoutError(f"{func.__name__} did not finish within {limit:g}s") from None
+            yield item, result
+
+class CircuitBreaker:
+    """Per-target circuit breaker for unreachable shares.
+
+    After threshold consecutive failures the target is skipped without any
+    I/O. While open, a background health probe runs whenever the backoff
+    expires; the backoff doubles on every failed probe or retry, up to
+    max_backoff. A successful probe lets the next tick through (half-open).
+    """
+
+    def __init__(self, threshold=DEFAULT_BREAKER_THRESHOLD, backoff=DEFAULT_BREAKER_BACKOFF,
+                 max_backoff=DEFAULT_BREAKER_MAX_BACKOFF):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.state = "closed"        # closed / open / half_open
+        self.failures = 0
+        self.opened = 0              # consecutive openings; drives the backoff
+        self.retry_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _current_backoff(self):
+        return min(self.backoff * 2 ** max(self.opened - 1, 0), self.max_backoff)
+
+    def allow(self):
+        with self._lock:
+            return self.state != "open"
+
+    def seconds_until_probe(self):
+        return max(0.0, self.retry_at - time.monotonic())
+
+    def record_failure(self, reason):
+        """Count a failed tick; returns a run-log note when the circuit opens."""
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+                self.state = "open"
+                self.opened += 1
+                backoff = self._current_backoff()
+                self.retry_at = time.monotonic() + backoff
+                return ("<CIRCUIT_OPEN>",
+                        f"Target skipped after {self.failures} failure(s), next probe in {backoff:g}s: {reason}")
+            return None
+
+    def record_success(self):
+        """Count a successful tick; returns a run-log note when the circuit closes."""
+        with self._lock:
+            self.failures = 0
+            if self.state == "closed":
+                return None
+            self.state = "closed"
+            self.opened = 0
+            return ("<CIRCUIT_CLOSED>", "Target reachable again")
+
+    def probe(self, rip_name, path, guard):
+        """Start a background health probe if one is due. Never blocks the caller."""
+        with self._lock:
+            if self.state != "open" or self._probing or time.monotonic() < self.retry_at:
+                return
+            self._probing = True
+
+        def run():
+            try:
+                ok = guard.call(os.path.isdir, path)
+            except Exception:
+                ok = False
+            with self._lock:
+                self._probing = False
+                if ok:
+                    self.state = "half_open"
+                else:
+                    self.opened += 1
+                    self.retry_at = time.monotonic() + self._current_backoff()
+            if ok:
+                console.summary(f"[{rip_name}] Health probe succeeded; retrying on the next tick.")
+            else:
+                console.warning(f"[{rip_name}] Health probe failed; next probe in {self.seconds_until_probe():.0f}s.")
+
+        threading.Thread(target=run, name=f"probe-{rip_name}", daemon=True).start()
+
+class RetryQueue:
+    """Deferred retries for locked files of one target, ordered by next attempt time.
+
+    Every failed attempt doubles the file's delay (base_delay, 2x, 4x, ...)
+    up to max_delay, so a file that stays locked for many ticks is checked
+    less and less often. Nothing ever sleeps; callers skip waiting files.
+    """
+
+    def __init__(self, base_delay=RETRY_DELAY_SECONDS, max_delay=DEFAULT_RETRY_MAX_BACKOFF):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._heap = []          # (next_attempt, name); superseded items are dropped lazily
+        self._entries = {}       # name -> (attempts, next_attempt, delay)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, name):
+        """Record a failed attempt for name; returns (attempts, delay)."""
+        with self._lock:
+            attempts = self._entries.get(name, (0, 0.0, 0.0))[0] + 1
+            delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+            next_attempt = time.monotonic() + delay
+            self._entries[name] = (attempts, next_attempt, delay)
+            heapq.heappush(self._heap, (next_attempt, name))
+            return attempts, delay
+
+    def info(self, name):
+        """Return (attempts, delay) of the last failed attempt for name."""
+        attempts, _next_attempt, delay = self._entries[name]
+        return attempts, delay
+
+    def is_waiting(self, name):
+        entry = self._entries.get(name)
+        return entry is not None and entry[1] > time.monotonic()
+
+    def discard(self, name):
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def prune(self):
+        """Forget files whose retry has been due for longer than max_delay (never seen again)."""
+        horizon = time.monotonic() - self.max_delay
+        with self._lock:
+            while self._heap and self._heap[0][0] <= horizon:
+                next_attempt, name = heapq.heappop(self._heap)
+                entry = self._entries.get(name)
+                if entry is not None and entry[1] == next_attempt:
+                    del self._entries[name]
+
+class TargetState:
+    """Runtime state kept for one RIP target between polling ticks."""
+
+    def __init__(self, rip_name):
+        self.rip_name = rip_name
+        self.snapshot = DirectorySnapshot()
+        self.guard = None
+        self.breaker = None
+        self.retry_queue = None
+        self.policy = None
+        self.daily_log = None
+        self.adaptive = None
+        self.boost_guard = None   # guard with emergency_concurrency for low free space cleanups
+        self._keys = {}   # runtime object -> settings it was built from
+
+    def ensure_runtime(self, general, target):
+        """Create the runtime objects on first use and rebuild those whose settings changed.
+
+        general and target are the compiled GeneralConfig / TargetConfig of
+        the running configuration; objects whose settings are unchanged (and
+        the state they hold) are kept across a configuration reload.
+        """
+        keys = {
+            "snapshot": (target.path, target.rules),
+            "guard": (general.fs_timeout, target.delete_concurrency),
+            "boost_guard": (general.fs_timeout, general.emergency_concurrency),
+            "breaker": (target.path, general.breaker_threshold, general.breaker_backoff,
+                        general.breaker_max_backoff),
+            "retry_queue": (target.path, general.retry_backoff, general.retry_max_backoff),
+            "daily_log": general.log_mode,
+            "adaptive": (target.polling_interval, general.adaptive_interval,
+                         general.min_polling_interval, general.max_polling_interval),
+        }
+        changed = [name for name, key in keys.items() if self._keys.get(name) != key]
+        reload = bool(self._keys)
+        self._keys = keys
+        self.policy = target.policy
+        if not changed:
+            return
+        if "snapshot" in changed:
+            self.snapshot = DirectorySnapshot()
+        if "guard" in changed:
+            if self.guard is not None:
+                self.guard.shutdown()
+            self.guard = CallGuard(self.rip_name, general.fs_timeout,
+                                   concurrency=target.delete_concurrency)
+        if "boost_guard" in changed:
+            if self.boost_guard is not None:
+                self.boost_guard.shutdown()
+            self.boost_guard = CallGuard(self.rip_name, general.fs_timeout,
+                                         concurrency=general.emergency_concurrency)
+        if "breaker" in changed:
+            self.breaker = CircuitBreaker(general.breaker_threshold, general.breaker_backoff,
+                                          general.breaker_max_backoff)
+        if "retry_queue" in changed:
+            self.retry_queue = RetryQueue(general.retry_backoff, general.retry_max_backoff)
+        if "daily_log" in changed:
+            self.daily_log = DailyLog(self.rip_name) if general.log_mode == "daily" else None
+        if "adaptive" in changed:
+            self.adaptive = None
+        if reload:
+            console.summary(f"[{self.rip_name}] Settings changed; rebuilt {', '.join(changed)}.")
+
+class AdaptiveInterval:
+    """Polling interval of one target that follows the rate new files arrive at.
+
+    The rate is smoothed over recent ticks. The interval aims at about
+    ADAPTIVE_TARGET_FILES new files per tick, changes by at most
+    ADAPTIVE_STEP per tick and stays between minimum and maximum minutes.
+    """
+
+    def __init__(self, rip_name, interval, minimum, maximum):
+        self.rip_name = rip_name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.interval = min(max(interval, minimum), maximum)
+        self.rate = None        # new files per minute
+        self._last_tick = None
+
+    def update(self, found, now=None):
+        """Feed the number of new files a tick found; returns the next interval in minutes."""
+        now = time.monotonic() if now is None else now
+        if self._last_tick is None:
+            elapsed = self.interval
+        else:
+            elapsed = max((now - self._last_tick) / 60, 1 / 60)
+        self._last_tick = now
+        rate = found / elapsed
+        self.rate = rate if self.rate is None else self.rate + ADAPTIVE_SMOOTHING * (rate - self.rate)
+
+        previous = self.interval
+        if self.rate > 0:
+            wanted = ADAPTIVE_TARGET_FILES / self.rate
+        else:
+            wanted = previous * ADAPTIVE_STEP
+        if found == 0:
+            wanted = max(wanted, previous)    # 空のティックで間隔を縮めない
+        wanted = min(max(wanted, previous / ADAPTIVE_STEP), previous * ADAPTIVE_STEP)
+        self.interval = min(max(wanted, self.minimum), self.maximum)
+        if round(self.interval, 2) != round(previous, 2):
+            change = "shortened" if self.interval < previous else "lengthened"
+            console.summary(f"[{self.rip_name}] Polling interval {change}: {previous:.2f} -> "
+                            f"{self.interval:.2f} minutes ({self.rate:.1f} new files/minute).")
+        return self.interval
+
+def get_polling_interval(config, rip_name):
+    """Per-target polling_interval, falling back to the [General] value."""
+    target = config.targets.get(rip_name)
+    return target.polling_interval if target is not None else config.general.polling_interval
+
+def next_polling_interval(config, result):
+    """Minutes until the next polling tick of result's target.
+
+    With adaptive_interval the interval follows the files found by the
+    target's recent ticks; otherwise it is polling_interval.
+    """
+    general = config.general
+    interval = get_polling_interval(config, result.rip_name)
+    if general.adaptive_interval:
+        state = get_target_state(result.rip_name)
+        if state.adaptive is None:
+            state.adaptive = AdaptiveInterval(result.rip_name, interval,
+                                              general.min_polling_interval,
+                                              general.max_polling_interval)
+        if result.status == "ok":
+            interval = state.adaptive.update(result.deleted)
+        else:
+            interval = state.adaptive.interval   # 失敗・無効ティックは到着率に含めない
+    metrics.set("polling_interval_seconds", result.rip_name, interval * 60)
+    return interval
+
+_target_states = {}
+_target_states_lock = threading.Lock()
+
+def get_target_state(rip_name):
+    with _target_states_lock:
+        state = _target_states.get(rip_name)
+        if state is None:
+            state = _target_states[rip_name] = TargetState(rip_name)
+        return state
 
 def is_file_locked(filepath):
     try:
@@ -43,10 +1070,10 @@ def is_file_locked(filepath):
         handle.close()
         return False
     except win32file.error as e:
-        print(f"File access error: {e}")
+        console.error(f"File access error: {e}")
         return True
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        console.error(f"Unexpected error: {e}")
         return True
 
 def is_file_complete(filepath):
@@ -61,24 +1088,23 @@ def is_file_complete(filepath):
             f.read(1)
         return True
     except OSError as e:
-        print(f"File access error: {e}")
+        console.error(f"File access error: {e}")
         return False
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        console.error(f"Unexpected error: {e}")
         return False
 
 def ensure_log_directory(log_dir):
-    """Ensure log directory exists; exit if it cannot be created or is not configured."""
+    """Ensure a log directory is configured; exit if not because logs are required.
+
+    The directory itself is created by the log pipeline, which spools
+    locally while it cannot be reached.
+    """
     if not log_dir:
-        print("Log directory not configured; logging is required. Exiting.")
-        sys.exit(1)
-    try:
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-        return True
-    except Exception as e:
-        print(f"Failed to create/access log directory '{log_dir}': {e}")
+        console.error("Log directory not configured; logging is required. Exiting.")
         sys.exit(1)
+    get_log_pipeline().check()
+    return True
 
 def is_file_ready_for_deletion(filepath):
     """Check if file is ready for deletion with minimal I/O"""
@@ -96,139 +1122,1660 @@ def is_file_ready_for_deletion(filepath):
             
         return True
     except Exception as e:
-        print(f"File check error: {e}")
+        console.error(f"File check error: {e}")
         return False
 
-def delete_matching_files(rip_name, path, log_dir):
-    if not ensure_log_directory(log_dir):
-        print(f"[{rip_name}] Log directory error. Skipping operation.")
-        return
+def open_scan(path, io_counts, scan_engine=DEFAULT_SCAN_ENGINE, snapshot=None,
+              full_scan_interval=DEFAULT_FULL_SCAN_INTERVAL, names=None, policy=DEFAULT_POLICY):
+    """Return (entries, listed) for one pass over path; raises OSError if it cannot be opened."""
+    if names is not None:
+        return iter_named_entries(path, names, io_counts, snapshot, policy), False
+    if snapshot is not None:
+        return iter_snapshot_entries(path, io_counts, snapshot, scan_engine, full_scan_interval,
+                                     policy)
+    return iter_matching_entries(path, io_counts, scan_engine, None, policy), True
+
+def print_scan_notice(rip_name, entries, listed, names):
+    if names is not None:
+        console.info(f"[{rip_name}] Checking {len(entries)} file(s) reported by watch events.")
+    elif not listed:
+        console.info(f"[{rip_name}] Folder unchanged; listing skipped ({len(entries)} pending).")
+
+def clean_entry(rip_name, entry, io_counts, max_retries=RETRY_MAX_ATTEMPTS,
+                retry_delay=RETRY_DELAY_SECONDS, final=True, timings=None):
+    """Check one MatchedEntry against its rule and delete it.
+
+    Returns (status, reason): ("deleted", None), ("gone", None) or ("skipped", reason).
+    With final=False a file still locked after max_retries returns ("locked", None)
+    so the caller can retry it later. Time spent in stat, remove and retry
+    sleeps is added to timings (a Counter) when given.
+    """
+    if timings is None:
+        timings = Counter()
+    status, reason = _clean_entry(rip_name, entry, io_counts, max_retries, retry_delay, final,
+                                  timings)
+    if status == "skipped":
+        metrics.inc("files_skipped", rip_name, label=skip_reason_label(reason))
+    return status, reason
+
+def _clean_entry(rip_name, entry, io_counts, max_retries, retry_delay, final, timings):
+    filename = entry.name
+    rule = entry.rule
+    metrics.inc("files_matched", rip_name)
+    try:
+        # ファイルのサイズ・更新時刻はスキャン結果から取得（追加の stat を避ける）
+        started = time.monotonic()
+        stats = get_entry_stat(entry, io_counts)
+        timings["stat"] += time.monotonic() - started
+        if stats.st_size < rule.min_size:
+            reason = "Empty file" if stats.st_size == 0 else f"Too small: {stats.st_size} bytes"
+            console.file(rip_name, f"Skipped ({reason}): {filename}")
+            return "skipped", reason
+        if rule.min_age and time.time() - stats.st_mtime < rule.min_age:
+            console.file(rip_name, f"Skipped (Too new): {filename}")
+            return "skipped", "Too new"
+
+        # 削除を試行
+        io_counts["remove"] += 1
+        started = time.monotonic()
+        waited = timings["retry_wait"]
+        deleted = delete_with_retry(entry.path, max_retries, retry_delay, timings)
+        elapsed = time.monotonic() - started
+        timings["delete"] += elapsed - (timings["retry_wait"] - waited)
+        metrics.observe("delete_seconds", rip_name, elapsed)
+        if deleted:
+            console.file(rip_name, f"Deleted: {filename}")
+            metrics.inc("files_deleted", rip_name)
+            metrics.inc("bytes_reclaimed", rip_name, stats.st_size)
+            io_counts["bytes"] += stats.st_size   # 回収量（I/O 回数ではない）
+            return "deleted", None
+        if not final:
+            return "locked", None
+        console.file(rip_name, f"Delete failed (after retry): {filename}", LEVEL_WARNING)
+        return "skipped", "Delete failed"
+
+    except FileNotFoundError:
+        # 前回スキャン以降に他から削除された
+        return "gone", None
+    except PermissionError:
+        console.file(rip_name, f"Skipped (In use): {filename}")
+        return "skipped", "In use"
+    except Exception as e:
+        console.file(rip_name, f"Error: {filename} → {e}", LEVEL_WARNING)
+        return "skipped", f"Error: {e}"
+
+def clean_entry_counted(rip_name, entry, max_retries=RETRY_MAX_ATTEMPTS,
+                        retry_delay=RETRY_DELAY_SECONDS, final=True):
+    """clean_entry with its own Counters, for calls running on several threads at once.
+
+    Returns (status, reason, io_counts, timings); the caller merges the counters.
+    """
+    io_counts = Counter()
+    timings = Counter()
+    status, reason = clean_entry(rip_name, entry, io_counts, max_retries, retry_delay, final,
+                                 timings)
+    return status, reason, io_counts, timings
+
+def record_outcome(filename, status, reason, run_log, snapshot=None):
+    if status == "deleted":
+        run_log.deleted(filename)
+    elif status == "skipped":
+        run_log.skipped(filename, reason)
+        if snapshot is not None:
+            snapshot.pending.add(filename)
+
+def skip_waiting_entries(entries, retry_queue, snapshot=None):
+    """Drop entries whose deferred retry is not due yet, keeping them pending in snapshot."""
+    for entry in entries:
+        if retry_queue.is_waiting(entry.name):
+            if snapshot is not None:
+                snapshot.pending.add(entry.name)
+            continue
+        yield entry
+
+def record_locked(rip_name, filename, retry_queue, run_log, snapshot=None):
+    attempts, delay = retry_queue.info(filename)
+    console.file(rip_name, f"Skipped (Locked, retry #{attempts} in {delay:g}s): {filename}")
+    metrics.inc("files_skipped", rip_name, label="Locked")
+    record_outcome(filename, "skipped", f"Delete failed (locked, next retry in {delay:g}s)",
+                   run_log, snapshot)
+
+def access_error_tick(rip_name, path, log_dir, now, error, snapshot=None, breaker=None,
+                      daily_log=None):
+    """Log an inaccessible path and return its TickResult."""
+    console.error(f"[{rip_name}] Failed to access path '{path}': {error}")
+    metrics.inc("files_skipped", rip_name, label="Access error")
+    if snapshot is not None:
+        snapshot.invalidate()
+    # Record access error in the existing skipped section (no log format change)
+    run_log = open_run_log(rip_name, log_dir, now, daily_log)
+    run_log.skipped("<ACCESS_ERROR>", f"Cannot access path '{path}': {error}")
+    note = breaker.record_failure(error) if breaker is not None else None
+    if note:
+        console.warning(f"[{rip_name}] {note[1]}")
+        run_log.skipped(*note)
+    run_log.close()
+    return TickResult(rip_name, "access_error", skipped=run_log.skipped_count)
+
+def finish_tick(rip_name, run_log, io_counts, scan_engine, breaker=None, failure=None,
+                timings=None, started=None, low_free_space=None):
+    """Print the I/O summary, close the run log and return the TickResult.
+
+    failure is the share error that interrupted the tick, if any; it is
+    reported to breaker together with successful ticks. The run log ends
+    with a summary of timings (phase times) and io_counts since started.
+    A tick started by a low free space cleanup gets a <LOW_FREE_SPACE>
+    record with the free space, the limit and the bytes reclaimed.
+    """
+    console.rollup(rip_name)
+    console.info(f"[{rip_name}] I/O calls ({scan_engine}): {format_io_counts(io_counts)}")
+    metrics.inc("files_enumerated", rip_name, io_counts["entries"])
+    if low_free_space is not None:
+        run_log.note("<LOW_FREE_SPACE>",
+                     f"Free space {low_free_space.free / 1e6:.0f} MB was below "
+                     f"{low_free_space.limit / 1e6:.0f} MB; reclaimed "
+                     f"{io_counts['bytes'] / 1e6:.1f} MB")
+    if breaker is not None:
+        note = breaker.record_failure(failure) if failure else breaker.record_success()
+        if note:
+            console.warning(f"[{rip_name}] {note[1]}")
+            run_log.skipped(*note)
+
+    summary = None
+    if timings is not None:
+        # 一覧は遅延して読まれるので、全体の時間はティックの終わりに分かる
+        metrics.observe("enumeration_seconds", rip_name, timings["list"])
+    if timings is not None and started is not None:
+        timings["log"] += run_log.seconds
+        summary = format_tick_summary(io_counts, timings, scan_engine, time.monotonic() - started)
+    run_log.close(summary)
+    if not run_log.written:  # 削除もスキップもなければログファイルは作らない
+        console.info(f"[{rip_name}] No files to delete.")
+    elif run_log.deleted_count or run_log.skipped_count:
+        console.summary(f"[{rip_name}] Deleted {run_log.deleted_count}, "
+                        f"skipped {run_log.skipped_count}.")
+    return TickResult(rip_name, "access_error" if failure else "ok",
+                      run_log.deleted_count, run_log.skipped_count, reclaimed=io_counts["bytes"])
+
+def interrupted_access(rip_name, path, error, run_log, snapshot=None):
+    # 列挙途中での切断・タイムアウトなど
+    console.warning(f"[{rip_name}] Access interrupted for '{path}': {error}")
+    metrics.inc("files_skipped", rip_name, label="Access error")
+    if snapshot is not None:
+        snapshot.invalidate()
+    run_log.skipped("<ACCESS_ERROR>", f"Access interrupted for '{path}': {error}")
+
+def stopped_tick(rip_name, run_log, snapshot=None):
+    # 停止要求で列挙を打ち切った（残りは次回の実行で処理する）
+    console.summary(f"[{rip_name}] Stopping; remaining files are left for the next run.")
+    if snapshot is not None:
+        snapshot.invalidate()
+    run_log.skipped("<STOPPED>", "Run stopped by shutdown; remaining files are left for the next run")
+
+def entry_deadline(guard, retry_queue=None):
+    """Deadline for one clean_entry call: the per-call timeout plus any inline retry sleeps."""
+    if retry_queue is not None:
+        return guard.timeout
+    return guard.timeout + RETRY_DELAY_SECONDS * (RETRY_MAX_ATTEMPTS - 1)
+
+def delete_matching_files(rip_name, path, log_dir, scan_engine=DEFAULT_SCAN_ENGINE,
+                          snapshot=None, full_scan_interval=DEFAULT_FULL_SCAN_INTERVAL,
+                          names=None, guard=None, breaker=None, retry_queue=None,
+                          policy=DEFAULT_POLICY, daily_log=None, low_free_space=None):
+    """Delete matching files in path and write the run log.
+
+    When names is given (watch mode), only those names plus the snapshot's
+    pending names are checked and the folder is not listed. Calls against
+    the share run under guard's deadline; the outcome is reported to breaker.
+    With a retry_queue, locked files are deferred instead of retried inline.
+    policy decides which names are handled and how (see compile_policy).
+    With a daily_log the run is appended to the target's daily file.
+    low_free_space is the LowFreeSpace that started the run, if any.
+    Returns a TickResult.
+    """
+    if not ensure_log_directory(log_dir):
+        console.error(f"[{rip_name}] Log directory error. Skipping operation.")
+        return TickResult(rip_name, "error")
+
+    guard = guard or CallGuard(rip_name, 0)
+    now = datetime.now().strftime(LOG_DATETIME_FORMAT)
+    io_counts = Counter()
+    timings = Counter()
+    started = time.monotonic()
+    failure = None
+
+    # Protect directory access against access/network errors
+    try:
+        entries, listed = guard.call(open_scan, path, io_counts, scan_engine, snapshot,
+                                     full_scan_interval, names, policy)
+        timings["list"] += time.monotonic() - started
+    except Exception as e:
+        return access_error_tick(rip_name, path, log_dir, now, e, snapshot, breaker, daily_log)
+
+    print_scan_notice(rip_name, entries, listed, names)
+    run_log = open_run_log(rip_name, log_dir, now, daily_log)
+
+    def clean(entry):
+        if retry_queue is None:
+            return clean_entry_counted(rip_name, entry)
+        # ロック中のファイルはその場で待たずに再試行キューへ回す
+        return clean_entry_counted(rip_name, entry, 1, 0, final=False)
+
+    deadline = entry_deadline(guard, retry_queue)
+    locked = {}
+
+    def run(candidates):
+        for entry, (status, reason, counts, spent) in guard.run_each(clean, candidates,
+                                                                     timeout=deadline):
+            io_counts.update(counts)
+            timings.update(spent)
+            if status == "locked":
+                retry_queue.schedule(entry.name)
+                metrics.inc("retries", rip_name)
+                locked[entry.name] = entry
+                continue
+            if retry_queue is not None:
+                retry_queue.discard(entry.name)
+                locked.pop(entry.name, None)
+            record_outcome(entry.name, status, reason, run_log, snapshot)
+
+    candidates = StopOnShutdown(timed(guard.iter(entries), timings, "list"))
+    try:
+        pending = candidates
+        if retry_queue is not None:
+            retry_queue.prune()
+            pending = skip_waiting_entries(candidates, retry_queue, snapshot)
+        # 削除は対象ごとの並列度でワーカーに流し、結果は呼び出し元スレッドで集計する
+        run(pending)
+        if locked and not candidates.stopped:
+            # 周期内で既に待ち時間を過ぎたものだけもう一度試す（sleep はしない）
+            run([entry for entry in locked.values() if not retry_queue.is_waiting(entry.name)])
+    except OSError as e:
+        failure = e
+        interrupted_access(rip_name, path, e, run_log, snapshot)
+    if candidates.stopped:
+        stopped_tick(rip_name, run_log, snapshot)
+
+    for name in sorted(locked):
+        record_locked(rip_name, name, retry_queue, run_log, snapshot)
+
+    return finish_tick(rip_name, run_log, io_counts, scan_engine, breaker, failure, timings, started,
+                       low_free_space)
+
+class LogPipeline:
+    """Background writer between the run logs and log_dir.
+
+    Writers hand over (path, text) chunks and return immediately. A single
+    thread appends them to their files, grouping up to LOG_GROUP_COMMIT
+    chunks per batch. While log_dir cannot be written, chunks are spooled
+    in order to numbered files in spool_dir (written with fsync) and replayed
+    every LOG_REPLAY_INTERVAL seconds until log_dir is back; new chunks keep
+    going to the spool until it is empty so the order never changes.
+    Only when the spool cannot be written either does check() exit.
+    """
+
+    def __init__(self, spool_dir):
+        self.spool_dir = spool_dir
+        self.error = None
+        self._queue = queue.Queue(LOG_QUEUE_CHUNKS)
+        self._handles = {}   # stream -> (path, file) kept open across batches (daily logs)
+        self._spool_lock = threading.Lock()
+        self._spooled = self._list_spool()
+        self._seq = int(self._spooled[-1].split(".")[0]) + 1 if self._spooled else 0
+        self._replay_at = 0.0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, path, text, stream=None):
+        """Queue text for path; chunks with a stream name keep their file open between batches."""
+        self.check()
+        self._queue.put((path, text, stream))
+
+    def check(self):
+        if self.error is not None:
+            console.error(f"Failed to write log: {self.error}")
+            sys.exit(1)
+
+    def flush(self):
+        """Block until every chunk handed over so far is written or spooled."""
+        self._queue.join()
+
+    def close(self, timeout=LOG_SHUTDOWN_TIMEOUT):
+        """Stop the writer; chunks it could not reach in time are spooled for the next start."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not None:
+                self._spool(*record[:2])
+
+    def _run(self):
+        while True:
+            try:
+                record = self._queue.get(timeout=LOG_REPLAY_INTERVAL)
+            except queue.Empty:
+                record = None
+                batch = []
+            else:
+                batch = [record]
+                while record is not None and len(batch) < LOG_GROUP_COMMIT:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    batch.append(record)
+            stop = batch and batch[-1] is None
+            try:
+                self._commit([r for r in batch if r is not None])
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                self._close_handles()
+                return
+
+    def _commit(self, batch):
+        if self._spooled and time.monotonic() >= self._replay_at:
+            self._replay()
+        # 同じファイルへの書き込みはまとめて 1 回で行う
+        grouped = {}
+        for path, text, stream in batch:
+            grouped.setdefault((path, stream), []).append(text)
+        for (path, stream), texts in grouped.items():
+            text = "".join(texts)
+            if self._spooled:
+                self._spool(path, text)
+                continue
+            try:
+                self._append(path, text, stream)
+            except OSError as e:
+                console.warning(f"Log directory unavailable; spooling logs to '{self.spool_dir}': {e}")
+                self._spool(path, text)
+                self._replay_at = time.monotonic() + LOG_REPLAY_INTERVAL
+
+    def _append(self, path, text, stream=None):
+        handle = None
+        if stream is not None:
+            open_path, handle = self._handles.get(stream, (None, None))
+            if open_path != path:
+                # 日付が変わったら前日のファイルは閉じる
+                self._drop_handle(stream, handle)
+                handle = None
+        try:
+            if handle is None:
+                try:
+                    handle = open(path, "a", encoding="utf-8")
+                except FileNotFoundError:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    handle = open(path, "a", encoding="utf-8")
+            handle.write(text)
+            handle.flush()
+        except OSError:
+            self._drop_handle(stream, handle)
+            raise
+        if stream is not None:
+            self._handles[stream] = (path, handle)
+        else:
+            handle.close()
+
+    def _drop_handle(self, stream, handle):
+        self._handles.pop(stream, None)
+        if handle is not None:
+            try:
+                handle.close()
+            except OSError:
+                pass
+
+    def _close_handles(self):
+        for stream, (_path, handle) in list(self._handles.items()):
+            self._drop_handle(stream, handle)
+
+    def _list_spool(self):
+        try:
+            return sorted(name for name in os.listdir(self.spool_dir) if name.endswith(".spool"))
+        except FileNotFoundError:
+            return []
+
+    def _spool(self, path, text):
+        with self._spool_lock:
+            try:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                name = f"{self._seq:012d}.spool"
+                temp_path = os.path.join(self.spool_dir, name + ".tmp")
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    f.write(f"{path}\n{text}")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, os.path.join(self.spool_dir, name))
+            except OSError as e:
+                self.error = f"cannot spool to '{self.spool_dir}': {e}"
+                console.error(f"Failed to write log: {self.error}")
+                return
+            self._seq += 1
+            self._spooled.append(name)
+
+    def _replay(self):
+        """Append spooled chunks to log_dir oldest first; stop at the first failure."""
+        replayed = 0
+        while self._spooled:
+            name = self._spooled[0]
+            spool_path = os.path.join(self.spool_dir, name)
+            try:
+                with open(spool_path, encoding="utf-8") as f:
+                    path = f.readline().rstrip("\n")
+                    text = f.read()
+                self._append(path, text)
+                os.remove(spool_path)
+            except OSError:
+                self._replay_at = time.monotonic() + LOG_REPLAY_INTERVAL
+                break
+            self._spooled.pop(0)
+            replayed += 1
+        if replayed and not self._spooled:
+            console.summary(f"Log directory available again; replayed {replayed} spooled log chunk(s).")
+
+_log_pipeline = None
+_log_pipeline_lock = threading.Lock()
+
+def get_log_pipeline(spool_dir=None):
+    """Return the process-wide LogPipeline, starting it on first use."""
+    global _log_pipeline
+    with _log_pipeline_lock:
+        if _log_pipeline is None:
+            _log_pipeline = LogPipeline(spool_dir or os.path.join(get_app_dir(), DEFAULT_LOG_SPOOL_DIR))
+            atexit.register(_log_pipeline.close)
+        return _log_pipeline
+
+# <...> entries of the Skipped Files section that report an event, not a skipped file
+LOG_NOTES = ("<LOW_FREE_SPACE>",)
+
+class RunLogWriter:
+    """Run log written while the tick runs instead of from lists at the end.
+
+    Deleted names are streamed into the "Deleted Files" section; skipped
+    records go to a spill buffer (in memory up to LOG_SPILL_MEMORY, then a
+    temporary file) and are appended as the "Skipped Files" section on close,
+    so the layout matches the old write_detailed_log output and memory stays
+    flat. Lines are handed to the log pipeline every LOG_FLUSH_RECORDS records
+    or LOG_FLUSH_SECONDS; nothing is written unless a record arrives. With
+    daily_log the run is appended to that file under a run header instead.
+    With events (an EventLog) every record is also written as a JSON line,
+    followed by an "end" record when the run is closed. The tick's timing and
+    I/O summary is only known at the end, so it follows the Skipped Files
+    section as a "=== Summary ===" block.
+    """
+
+    def __init__(self, log_path, daily_log=None, retention=None, events=None):
+        self.log_path = log_path
+        self._retention = retention
+        self._events = events
+        self._event_lines = []
+        self._run = None
+        self.seconds = 0.0   # time spent handing records to the log pipeline
+        self.deleted_count = 0
+        self.skipped_count = 0
+        self._daily_log = daily_log
+        self._stream = daily_log.rip_name if daily_log is not None else None
+        self._pipeline = None
+        self._pending = []
+        self._spill = None
+        self._closed = False
+        self._flushed_at = 0.0
+
+    @property
+    def written(self):
+        return self._pipeline is not None
+
+    def open(self):
+        if self._pipeline is not None:
+            return
+        self._pipeline = get_log_pipeline()
+        self._pipeline.check()
+        if self._retention is not None:
+            self._retention.note(self.log_path)
+            if self._events is not None:
+                self._retention.note(self._events.path)
+        if self._daily_log is not None:
+            self._pending.append(f"\n##### {self._daily_log.rip_name} run #####\n")
+        started = datetime.now().strftime(DETAILED_DATETIME_FORMAT)
+        self._run = log_run_id(self.log_path, started)
+        self._pending.append(f"Execution time: {started}\n")
+        self._pending.append("\n=== Deleted Files ===\n")
+        self._spill = tempfile.SpooledTemporaryFile(LOG_SPILL_MEMORY, mode="w+", encoding="utf-8")
+        self._flushed_at = time.monotonic()
+        with _open_run_logs_lock:
+            _open_run_logs.add(self)
+
+    def deleted(self, filename):
+        started = time.monotonic()
+        self.open()
+        self.deleted_count += 1
+        self._pending.append(f"{filename}\n")
+        self._event("deleted", filename)
+        self._maybe_flush()
+        self.seconds += time.monotonic() - started
+
+    def skipped(self, filename, reason, event="skipped"):
+        started = time.monotonic()
+        self.open()
+        if event == "skipped":
+            self.skipped_count += 1
+        self._spill.write(f"{filename} (Reason: {reason})\n")
+        self._event(event, filename, reason)
+        self._maybe_flush()
+        self.seconds += time.monotonic() - started
+
+    def note(self, marker, text):
+        """Write a LOG_NOTES entry to the Skipped Files section without counting it as skipped."""
+        self.skipped(marker, text, "note")
+
+    def _event(self, event, filename=None, reason=None, **extra):
+        if self._events is None:
+            return
+        record = {"ts": datetime.now().isoformat(timespec="milliseconds"),
+                  "target": self._events.rip_name, "run": self._run, "event": event}
+        if filename is not None:
+            record["file"] = filename
+        if reason is not None:
+            record["reason"] = reason
+        record.update(extra)
+        self._event_lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _maybe_flush(self):
+        if (len(self._pending) >= LOG_FLUSH_RECORDS
+                or time.monotonic() - self._flushed_at >= LOG_FLUSH_SECONDS):
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._pipeline.write(self.log_path, "".join(self._pending), self._stream)
+            self._pending = []
+        if self._event_lines:
+            self._pipeline.write(self._events.path, "".join(self._event_lines), self._events.stream)
+            self._event_lines = []
+        self._flushed_at = time.monotonic()
+
+    def close(self, summary=None):
+        """Finish the run; summary lines are written as a final "=== Summary ===" block."""
+        if self._pipeline is None or self._closed:
+            return
+        self._closed = True
+        with _open_run_logs_lock:
+            _open_run_logs.discard(self)
+        self._pending.append("\n=== Skipped Files ===\n")
+        self._flush()
+        try:
+            self._spill.seek(0)
+            while True:
+                chunk = self._spill.read(LOG_SPILL_MEMORY)
+                if not chunk:
+                    break
+                self._pipeline.write(self.log_path, chunk, self._stream)
+        finally:
+            self._spill.close()
+        if summary:
+            self._pending.append("\n=== Summary ===\n" + "".join(f"{line}\n" for line in summary))
+        self._event("end", deleted=self.deleted_count, skipped=self.skipped_count)
+        self._flush()
+
+# run logs of ticks still in progress (closed by flush_state on a forced exit)
+_open_run_logs = weakref.WeakSet()
+_open_run_logs_lock = threading.Lock()
+
+def close_open_run_logs(note):
+    """Close the run logs of unfinished ticks with note as their summary."""
+    with _open_run_logs_lock:
+        run_logs = list(_open_run_logs)
+    for run_log in run_logs:
+        run_log.close([note])
+
+class EventLog:
+    """Per-target, per-day JSON Lines file written next to the run logs."""
+
+    def __init__(self, path, rip_name):
+        self.path = path
+        self.rip_name = rip_name
+        self.stream = f"{rip_name}.events"
+
+def log_run_id(log_path, started):
+    """Identifies one run in both the run log and the event stream."""
+    name = os.path.basename(log_path)
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return f"{name}@{started}"
+
+class DailyLog:
+    """Names the one log file per target per day that daily runs are appended to.
+
+    The log pipeline keeps the file open across ticks.
+    """
+
+    def __init__(self, rip_name):
+        self.rip_name = rip_name
+
+    def file_name(self):
+        return f"{datetime.now().strftime(DAILY_LOG_DATE_FORMAT)}_{self.rip_name}.log"
+
+def open_run_log(rip_name, log_dir, now, daily_log=None):
+    """RunLogWriter for one tick: a new <now>_<RIP>.log file, or the target's daily file.
+
+    When a retention manager runs for log_dir, it places the file (day
+    buckets) and indexes it.
+    """
+    name = daily_log.file_name() if daily_log is not None else f"{now}_{rip_name}.log"
+    events_name = f"{datetime.now().strftime(DAILY_LOG_DATE_FORMAT)}_{rip_name}{EVENT_LOG_SUFFIX}"
+    retention = get_log_retention(log_dir)
+    place = retention.path_for if retention is not None else lambda n: os.path.join(log_dir, n)
+    events = None
+    if log_dir in _event_log_dirs:
+        events = EventLog(place(events_name), rip_name)
+    return RunLogWriter(place(name), daily_log, retention, events)
+
+def write_detailed_log(log_path, deleted_files, skipped_files):
+    """Write detailed log through the log pipeline."""
+    run_log = RunLogWriter(log_path)
+    run_log.open()
+    for name in deleted_files:
+        run_log.deleted(name)
+    for name, reason in skipped_files:
+        run_log.skipped(name, reason)
+    run_log.close()
+
+def get_app_dir():
+    """Directory of the executable (or of this script when not frozen)."""
+    if getattr(sys, 'frozen', False):
+        # PyInstallerでビルドされた場合
+        return os.path.dirname(sys.executable)
+    # 通常のPython実行の場合
+    return os.path.dirname(os.path.abspath(__file__))
+
+def get_config_path():
+    """Get the config.ini path relative to the executable"""
+    config_path = os.path.join(get_app_dir(), "config.ini")
+    
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"Configuration file not found: {config_path}")
+    return config_path
+
+GeneralConfig = namedtuple(
+    "GeneralConfig",
+    "log_dir polling_interval adaptive_interval min_polling_interval max_polling_interval "
+    "overrun_policy startup_jitter scan_engine incremental_scan full_scan_interval "
+    "target_workers fs_timeout breaker_threshold breaker_backoff breaker_max_backoff "
+    "retry_backoff retry_max_backoff log_mode engine async_concurrency watch_debounce "
+    "watch_rescan_interval console_level drain_timeout free_space_interval "
+    "emergency_concurrency")
+# rules: comparable form of the file rules; policy: the Policy compiled from them (None when disabled)
+TargetConfig = namedtuple("TargetConfig",
+                          "name enabled path polling_interval delete_concurrency min_free_mb "
+                          "min_free_percent rules policy")
+# raw: the ConfigParser, for settings that are only read at start-up
+AppConfig = namedtuple("AppConfig", "general targets raw")
+
+def compile_config(config):
+    """Turn a validated ConfigParser into an immutable AppConfig.
+
+    Ticks read these typed values instead of parsing config sections again.
+    """
+    general = config["General"]
+    compiled = GeneralConfig(
+        log_dir=general.get("log_dir", ""),
+        polling_interval=general.getfloat("polling_interval", fallback=DEFAULT_POLLING_INTERVAL),
+        adaptive_interval=general.getboolean("adaptive_interval", fallback=False),
+        min_polling_interval=general.getfloat("min_polling_interval",
+                                              fallback=DEFAULT_MIN_POLLING_INTERVAL),
+        max_polling_interval=general.getfloat("max_polling_interval",
+                                              fallback=DEFAULT_MAX_POLLING_INTERVAL),
+        overrun_policy=general.get("overrun_policy", DEFAULT_OVERRUN_POLICY),
+        startup_jitter=general.getfloat("startup_jitter", fallback=0.0),
+        scan_engine=general.get("scan_engine", DEFAULT_SCAN_ENGINE),
+        incremental_scan=general.getboolean("incremental_scan", fallback=True),
+        full_scan_interval=general.getfloat("full_scan_interval", fallback=DEFAULT_FULL_SCAN_INTERVAL),
+        target_workers=general.getint("target_workers", fallback=DEFAULT_TARGET_WORKERS),
+        fs_timeout=general.getfloat("fs_timeout", fallback=DEFAULT_FS_TIMEOUT),
+        breaker_threshold=general.getint("breaker_threshold", fallback=DEFAULT_BREAKER_THRESHOLD),
+        breaker_backoff=general.getfloat("breaker_backoff", fallback=DEFAULT_BREAKER_BACKOFF),
+        breaker_max_backoff=general.getfloat("breaker_max_backoff",
+                                             fallback=DEFAULT_BREAKER_MAX_BACKOFF),
+        retry_backoff=general.getfloat("retry_backoff", fallback=RETRY_DELAY_SECONDS),
+        retry_max_backoff=general.getfloat("retry_max_backoff", fallback=DEFAULT_RETRY_MAX_BACKOFF),
+        log_mode=general.get("log_mode", DEFAULT_LOG_MODE),
+        engine=general.get("engine", DEFAULT_ENGINE),
+        async_concurrency=general.getint("async_concurrency", fallback=DEFAULT_ASYNC_CONCURRENCY),
+        watch_debounce=general.getfloat("watch_debounce", fallback=DEFAULT_WATCH_DEBOUNCE),
+        watch_rescan_interval=general.getfloat("watch_rescan_interval",
+                                               fallback=DEFAULT_WATCH_RESCAN_INTERVAL),
+        console_level=general.get("console_level", DEFAULT_CONSOLE_LEVEL),
+        drain_timeout=general.getfloat("drain_timeout", fallback=DEFAULT_DRAIN_TIMEOUT),
+        free_space_interval=general.getfloat("free_space_interval",
+                                             fallback=DEFAULT_FREE_SPACE_INTERVAL),
+        emergency_concurrency=general.getint("emergency_concurrency",
+                                             fallback=DEFAULT_EMERGENCY_CONCURRENCY))
+    concurrency = general.getint("delete_concurrency", fallback=DEFAULT_DELETE_CONCURRENCY)
+    min_free_mb = general.getfloat("min_free_mb", fallback=0.0)
+    min_free_percent = general.getfloat("min_free_percent", fallback=0.0)
+    targets = {}
+    for rip in VALID_RIPS:
+        if rip not in config:
+            continue
+        section = config[rip]
+        enabled = section.getboolean("enabled", fallback=False)
+        policy = compile_policy(config, rip) if enabled else None
+        rules = tuple((r.name, r.pattern, r.action, r.min_size, r.min_age, r.extension, r.prefix)
+                      for r in policy.rules) if policy else ()
+        targets[rip] = TargetConfig(rip, enabled, section.get("path", ""),
+                                    section.getfloat("polling_interval",
+                                                     fallback=compiled.polling_interval),
+                                    section.getint("delete_concurrency", fallback=concurrency),
+                                    section.getfloat("min_free_mb", fallback=min_free_mb),
+                                    section.getfloat("min_free_percent", fallback=min_free_percent),
+                                    rules, policy)
+    return AppConfig(compiled, MappingProxyType(targets), config)
+
+def load_config(config_file=None):
+    """Read, validate and compile config.ini; returns an AppConfig."""
+    config = configparser.ConfigParser()
+    config.read(config_file or get_config_path(), encoding="utf-8")
+    validate_config(config)
+    return compile_config(config)
+
+class ConfigReloader:
+    """Watches config.ini and swaps in a newly compiled configuration between ticks.
+
+    check() costs one stat at most every CONFIG_WATCH_INTERVAL seconds. A
+    change is loaded once the file has stayed the same for one interval, so
+    a half-written file is not picked up. A file that fails validation is
+    reported and the running configuration is kept. log_dir keeps its
+    start-up value, like the other RESTART_SETTINGS.
+    """
+
+    def __init__(self, config, config_file=None):
+        self.config = config
+        self.path = config_file or get_config_path()
+        self._stamp = self._stat()
+        self._pending = None
+        self._next_check = time.monotonic() + CONFIG_WATCH_INTERVAL
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def check(self):
+        """Reload config.ini if it changed.
+
+        Returns the names of the targets whose settings changed when a new
+        configuration was swapped in, otherwise None.
+        """
+        now = time.monotonic()
+        if now < self._next_check:
+            return None
+        self._next_check = now + CONFIG_WATCH_INTERVAL
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return None
+        if stamp != self._pending:
+            self._pending = stamp   # 書き込み途中の可能性があるので次回まで待つ
+            return None
+        self._stamp = stamp
+        try:
+            config = load_config(self.path)
+        except Exception as e:
+            console.error(f"Configuration reload failed ({e}); keeping the running configuration.")
+            return None
+        # ログの保持・イベントログ・トレンドは起動時の log_dir で動くので、実行ログもそこに残す
+        config = config._replace(general=config.general._replace(log_dir=self.config.general.log_dir))
+        old, self.config = self.config, config
+        return self._report(old, config)
+
+    def _report(self, old, new):
+        changed = [rip for rip in VALID_RIPS
+                   if _target_key(old.targets.get(rip)) != _target_key(new.targets.get(rip))]
+        if old.general != new.general:
+            changed = [rip for rip in VALID_RIPS if rip in old.targets or rip in new.targets]
+        console.level = CONSOLE_LEVELS.index(new.general.console_level)
+        console.summary(f"Configuration reloaded; changed: {', '.join(changed) or 'none'}.")
+        restart = [key for key in RESTART_SETTINGS
+                   if old.raw["General"].get(key) != new.raw["General"].get(key)]
+        if restart:
+            console.warning(f"Changes to {', '.join(restart)} take effect after a restart.")
+        return changed
+
+def _target_key(target):
+    return target._replace(policy=None) if target is not None else None
+
+def run_for_rip(config, rip_name, names=None, boost=None):
+    """Run one cleaning pass for rip_name and return its TickResult.
+
+    names restricts the pass to files reported by watch events. boost is
+    the LowFreeSpace that asked for the pass (or None); files are then
+    deleted with emergency_concurrency.
+    """
+    started = time.monotonic()
+    result = _run_for_rip(config, rip_name, names, boost)
+    result.duration = time.monotonic() - started
+    record_tick_metrics(result)
+    return result
+
+def record_tick_metrics(result):
+    """Tick duration, status and backlog of a finished pass."""
+    metrics.inc("ticks", result.rip_name, label=result.status)
+    if result.status in ("missing", "disabled"):
+        return
+    metrics.observe("tick_duration_seconds", result.rip_name, result.duration)
+    state = get_target_state(result.rip_name)
+    backlog = len(state.snapshot.pending)
+    if state.retry_queue is not None:
+        backlog = max(backlog, len(state.retry_queue))
+    metrics.set("backlog_files", result.rip_name, backlog)
+    if _trend_store is not None:
+        _trend_store.record(result, backlog)
+
+TargetSettings = namedtuple(
+    "TargetSettings",
+    "path log_dir scan_engine snapshot full_scan_interval guard breaker retry_queue policy "
+    "daily_log")
+
+def get_target_settings(config, rip_name):
+    """Return the TargetSettings for rip_name.
+
+    Returns a TickResult instead when the target is not configured or disabled.
+    """
+    target = config.targets.get(rip_name)
+    if target is None:
+        console.warning(f"[{rip_name}] Configuration not found.")
+        return TickResult(rip_name, "missing")
+
+    if not target.enabled:
+        console.info(f"[{rip_name}] Disabled.")
+        return TickResult(rip_name, "disabled")
+
+    general = config.general
+    state = get_target_state(rip_name)
+    state.ensure_runtime(general, target)
+    snapshot = None
+    if general.incremental_scan:
+        snapshot = state.snapshot
+    return TargetSettings(target.path,
+                          general.log_dir,
+                          general.scan_engine,
+                          snapshot,
+                          general.full_scan_interval,
+                          state.guard,
+                          state.breaker,
+                          state.retry_queue,
+                          state.policy,
+                          state.daily_log)
+
+def circuit_open_tick(rip_name, settings):
+    """Skip a target whose circuit is open, starting a background probe when due."""
+    settings.breaker.probe(rip_name, settings.path, settings.guard)
+    console.info(f"[{rip_name}] Target unreachable; skipped "
+                 f"(next probe in {settings.breaker.seconds_until_probe():.0f}s).")
+    return TickResult(rip_name, "circuit_open")
+
+def missing_path_tick(rip_name, settings, error=None):
+    """Report a path that is missing or timed out, recording breaker state changes."""
+    if error is not None:
+        console.warning(f"[{rip_name}] Path check failed: {settings.path}: {error}")
+    else:
+        console.warning(f"[{rip_name}] Path does not exist: {settings.path}")
+    note = settings.breaker.record_failure(error or f"Path does not exist: {settings.path}")
+    if note and ensure_log_directory(settings.log_dir):
+        console.warning(f"[{rip_name}] {note[1]}")
+        now = datetime.now().strftime(LOG_DATETIME_FORMAT)
+        run_log = open_run_log(rip_name, settings.log_dir, now, settings.daily_log)
+        run_log.open()
+        run_log.skipped(*note)
+        run_log.close()
+    return TickResult(rip_name, "missing")
+
+def _run_for_rip(config, rip_name, names, boost=None):
+    settings = get_target_settings(config, rip_name)
+    if isinstance(settings, TickResult):
+        return settings
+    if boost:
+        settings = settings._replace(guard=get_target_state(rip_name).boost_guard)
+    if not settings.breaker.allow():
+        return circuit_open_tick(rip_name, settings)
+    try:
+        exists = settings.guard.call(os.path.isdir, settings.path)
+    except TimeoutError as e:
+        return missing_path_tick(rip_name, settings, e)
+    if not exists:
+        return missing_path_tick(rip_name, settings)
+
+    return delete_matching_files(rip_name, settings.path, settings.log_dir, settings.scan_engine,
+                                 settings.snapshot, settings.full_scan_interval, names,
+                                 settings.guard, settings.breaker, settings.retry_queue,
+                                 settings.policy, settings.daily_log, boost)
+
+class TargetRunner:
+    """Persistent worker pool that runs RIP targets in parallel.
+
+    A target that is still running is never submitted a second time.
+    """
+
+    def __init__(self, workers=DEFAULT_TARGET_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="target")
+        self._lock = threading.Lock()
+        self._running = set()
+
+    def submit(self, config, rip_name, names=None, boost=None):
+        """Schedule one pass for rip_name; returns a Future, or None if it is already running."""
+        with self._lock:
+            if rip_name in self._running:
+                return None
+            self._running.add(rip_name)
+        try:
+            return self._executor.submit(self._run, config, rip_name, names, boost)
+        except Exception:
+            self._release(rip_name)
+            raise
+
+    def _run(self, config, rip_name, names, boost):
+        try:
+            return run_for_rip(config, rip_name, names, boost)
+        finally:
+            self._release(rip_name)
+
+    def _release(self, rip_name):
+        with self._lock:
+            self._running.discard(rip_name)
+
+    def run_all(self, config, rip_names, names_by_rip=None, boost=None):
+        """Run the given targets in parallel and wait; returns {rip_name: TickResult}.
+
+        Targets in boost ({rip_name: LowFreeSpace}) run with emergency_concurrency.
+        """
+        names_by_rip = names_by_rip or {}
+        boost = boost or {}
+        futures = {}
+        results = {}
+        for rip in rip_names:
+            future = self.submit(config, rip, names_by_rip.get(rip), boost.get(rip))
+            if future is None:
+                console.warning(f"[{rip}] Previous run still in progress; skipped.")
+                results[rip] = TickResult(rip, "busy")
+            else:
+                futures[rip] = future
+        for rip, future in futures.items():
+            try:
+                results[rip] = future.result()
+            except Exception as e:
+                console.error(f"[{rip}] Unexpected error: {e}")
+                results[rip] = TickResult(rip, "error")
+        return results
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+def create_target_runner(config):
+    return TargetRunner(config.general.target_workers)
+
+def print_tick_summary(results, elapsed):
+    parts = [f"{r.rip_name}={r.status}/{r.deleted}del/{r.duration:.1f}s" for r in results.values()]
+    console.summary(f"Tick finished in {elapsed:.1f}s: {' '.join(parts)}")
+
+def polling_started_message(config, engine=""):
+    general = config.general
+    if general.adaptive_interval:
+        schedule = (f"Adaptive interval between {general.min_polling_interval} and "
+                    f"{general.max_polling_interval} minutes, starting at {general.polling_interval}.")
+    else:
+        schedule = f"Running every {general.polling_interval} minutes."
+    return f"Started in polling mode{engine}. {schedule}"
+
+class TargetSchedule:
+    """Monotonic tick deadlines of one polling target.
+
+    Deadlines lie on a fixed grid (previous deadline + interval), so the time
+    a tick takes does not delay the ticks after it. A tick that ends after
+    its next slot has begun is an overrun, handled by policy:
+    skip drops the missed slots and waits for the next one on the grid,
+    catch_up runs the missed slots back to back (at most CATCH_UP_MAX_SLOTS),
+    coalesce runs one tick at once for all of them and restarts the grid there.
+    """
+
+    def __init__(self, rip_name, policy=DEFAULT_OVERRUN_POLICY, jitter=0.0, now=None):
+        now = time.monotonic() if now is None else now
+        self.rip_name = rip_name
+        self.policy = policy
+        self.deadline = now + random.uniform(0, jitter) if jitter > 0 else now
+
+    def complete(self, interval, finished=None):
+        """Record the end of the tick due at self.deadline; returns the next deadline.
+
+        interval is the target's next interval in minutes.
+        """
+        finished = time.monotonic() if finished is None else finished
+        period = interval * 60
+        scheduled = self.deadline
+        self.deadline = scheduled + period
+        if finished <= self.deadline:
+            return self.deadline
+
+        missed = int((finished - scheduled) // period)
+        if self.policy == "skip":
+            self.deadline = scheduled + (missed + 1) * period
+            action = "skipping to the next slot"
+        elif self.policy == "catch_up":
+            if missed > CATCH_UP_MAX_SLOTS:
+                self.deadline = scheduled + (missed + 1 - CATCH_UP_MAX_SLOTS) * period
+            action = f"catching up {min(missed, CATCH_UP_MAX_SLOTS)} slot(s)"
+        else:
+            self.deadline = finished
+            action = "running once now"
+        metrics.inc("ticks_overrun", self.rip_name, label=self.policy)
+        console.warning(f"[{self.rip_name}] Tick overran its {interval:g} minute slot by "
+                        f"{finished - scheduled - period:.1f}s ({missed} slot(s) missed); {action}.")
+        return self.deadline
+
+def create_schedules(config):
+    general = config.general
+    return {rip: TargetSchedule(rip, general.overrun_policy, general.startup_jitter)
+            for rip in VALID_RIPS}
+
+def apply_reload(reloader, schedules, busy=()):
+    """Check config.ini; targets whose settings changed run at their next check-in.
+
+    A new overrun_policy applies from the next overrun. Returns the
+    configuration to use for the ticks started from now on.
+    """
+    changed = reloader.check()
+    if changed is not None:
+        for schedule in schedules.values():
+            schedule.policy = reloader.config.general.overrun_policy
+    if changed:
+        now = time.monotonic()
+        for rip in changed:
+            if rip not in busy:
+                schedules[rip].deadline = min(schedules[rip].deadline, now)
+    return reloader.config
+
+def run_polling_mode(config):
+    """Polling mode: every target runs on its own schedule, independent of the others.
+
+    config.ini is watched; a changed configuration is swapped in between ticks.
+    """
+    console.summary(polling_started_message(config))
+    schedules = create_schedules(config)
+    runner = create_target_runner(config)
+    reloader = ConfigReloader(config)
+    FreeSpaceWatchdog(lambda: reloader.config).start()
+    running = {}   # Future -> rip_name
+    kicked = {}    # Future -> kick request it serves
+    off_grid = set()   # kicked ticks that did not fall on a scheduled slot
+    try:
+        while not shutdown.requested.is_set():
+            busy = set(running.values())
+            config = apply_reload(reloader, schedules, busy)
+            now = time.monotonic()
+            for rip, (kick, boost) in kicks.take(exclude=busy).items():
+                future = runner.submit(config, rip, boost=boost)
+                running[future] = rip
+                kicked[future] = kick
+                if now < schedules[rip].deadline:
+                    off_grid.add(future)
+            busy = set(running.values())
+            for rip, schedule in schedules.items():
+                if rip not in busy and now >= schedule.deadline:
+                    future = runner.submit(config, rip)
+                    if future is not None:
+                        running[future] = rip
+
+            busy = set(running.values())
+            idle = [s.deadline for rip, s in schedules.items() if rip not in busy]
+            timeout = SHUTDOWN_POLL_INTERVAL
+            if idle:
+                timeout = min(timeout, max(0.0, min(idle) - time.monotonic()))
+            if not running:
+                kicks.wait(timeout)
+                continue
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                rip = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    console.error(f"[{rip}] Unexpected error: {e}")
+                    result = TickResult(rip, "error")
+                if future in kicked:
+                    kicked.pop(future).set_result(result)
+                if future in off_grid:
+                    off_grid.discard(future)   # 予定外のキックは周期を動かさない
+                else:
+                    schedules[rip].complete(next_polling_interval(config, result))
+        drain(running)
+        kicks.cancel()
+    except KeyboardInterrupt:
+        console.summary("Polling interrupted.")
+    finally:
+        runner.shutdown(wait=False)
+
+def drain(running):
+    """Wait for the ticks still running after a stop request ({Future: rip_name}).
+
+    Waits in short steps so a second signal is handled; the drain deadline
+    itself is enforced by Shutdown.
+    """
+    if running:
+        console.summary(f"Waiting for {', '.join(sorted(running.values()))} to finish.")
+    while running:
+        done, _ = wait(running, timeout=SHUTDOWN_POLL_INTERVAL)
+        for future in done:
+            running.pop(future)
 
-    now = datetime.now().strftime(LOG_DATETIME_FORMAT)
-    deleted_files = []
-    skipped_files = []
+# inotify (Linux)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+_INOTIFY_EVENT = struct.Struct("iIII")
+# ReadDirectoryChangesW (Windows)
+FILE_LIST_DIRECTORY = 0x0001
+FILE_ACTION_ADDED = 1
+FILE_ACTION_MODIFIED = 3
+FILE_ACTION_RENAMED_NEW_NAME = 5
+
+class WatchQueue:
+    """Coalesces file events per target until they have been quiet for the debounce time."""
+
+    def __init__(self, debounce, matchers=None):
+        self.debounce = debounce
+        self.matchers = matchers or {}   # rip_name -> callable(name), truthy for relevant names
+        self._cond = threading.Condition()
+        self._names = {}        # rip_name -> set of reported names
+        self._first = {}        # rip_name -> monotonic time of the first pending event
+        self._last = {}         # rip_name -> monotonic time of the latest event
+        self._rescan = set()    # targets whose events were lost (overflow)
+        self._failed = {}       # rip_name -> error that stopped the watcher
+        self.events_seen = {}   # rip_name -> number of matching names ever reported
+
+    def add(self, rip_name, names, overflow=False):
+        match = self.matchers.get(rip_name, is_valid_tiff)
+        matching = [name for name in names if match(name)]
+        with self._cond:
+            if overflow:
+                self._rescan.add(rip_name)
+            if matching:
+                now = time.monotonic()
+                self._names.setdefault(rip_name, set()).update(matching)
+                self._first.setdefault(rip_name, now)
+                self._last[rip_name] = now
+                self.events_seen[rip_name] = self.events_seen.get(rip_name, 0) + len(matching)
+            if overflow or matching:
+                self._cond.notify()
+
+    def fail(self, rip_name, error):
+        with self._cond:
+            self._failed[rip_name] = error
+            self._cond.notify()
+
+    def wait(self, timeout):
+        with self._cond:
+            self._cond.wait(timeout)
 
-    # Protect os.listdir against access/network errors
+    def take_ready(self):
+        """Return (ready, rescan, failed): names whose debounce expired, overflowed and failed targets."""
+        now = time.monotonic()
+        ready = {}
+        with self._cond:
+            for rip_name in list(self._names):
+                if (now - self._last[rip_name] >= self.debounce
+                        or now - self._first[rip_name] >= WATCH_MAX_DELAY):
+                    ready[rip_name] = self._names.pop(rip_name)
+                    del self._first[rip_name], self._last[rip_name]
+            rescan, self._rescan = self._rescan, set()
+            failed, self._failed = self._failed, {}
+        return ready, rescan, failed
+
+    def next_deadline(self):
+        with self._cond:
+            deadlines = [min(self._last[r] + self.debounce, self._first[r] + WATCH_MAX_DELAY)
+                         for r in self._names]
+        return min(deadlines) if deadlines else None
+
+def _open_inotify(path):
+    libc = ctypes.CDLL(None, use_errno=True)
+    fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+    if libc.inotify_add_watch(fd, os.fsencode(path), mask) < 0:
+        err = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(err, f"inotify_add_watch failed for '{path}'")
+    return fd
+
+def _watch_inotify(fd, rip_name, queue, stop_event):
     try:
-        entries = os.listdir(path)
-    except Exception as e:
-        print(f"[{rip_name}] Failed to access path '{path}': {e}")
-        # Record access error using existing skipped_files format (no log format change)
-        skipped_files.append(("<ACCESS_ERROR>", f"Cannot access path '{path}': {e}"))
-        log_filename = f"{now}_{rip_name}.log"
-        log_path = os.path.join(log_dir, log_filename)
-        write_detailed_log(log_path, deleted_files, skipped_files)
+        while not stop_event.is_set():
+            ready, _, _ = select.select([fd], [], [], 1.0)
+            if not ready:
+                continue
+            data = os.read(fd, 65536)
+            names = []
+            overflow = False
+            offset = 0
+            while offset < len(data):
+                _wd, mask, _cookie, length = _INOTIFY_EVENT.unpack_from(data, offset)
+                offset += _INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                elif mask & IN_IGNORED:
+                    raise OSError("watched folder was removed or unmounted")
+                elif name:
+                    names.append(os.fsdecode(name))
+            queue.add(rip_name, names, overflow)
+    finally:
+        os.close(fd)
+
+def _open_win32_watch(path):
+    return win32file.CreateFile(
+        path,
+        FILE_LIST_DIRECTORY,
+        win32con.FILE_SHARE_READ | win32con.FILE_SHARE_WRITE | win32con.FILE_SHARE_DELETE,
+        None,
+        win32con.OPEN_EXISTING,
+        win32con.FILE_FLAG_BACKUP_SEMANTICS,
+        None
+    )
+
+def _watch_win32(handle, rip_name, queue, stop_event):
+    flags = (win32con.FILE_NOTIFY_CHANGE_FILE_NAME
+             | win32con.FILE_NOTIFY_CHANGE_SIZE
+             | win32con.FILE_NOTIFY_CHANGE_LAST_WRITE)
+    wanted = (FILE_ACTION_ADDED, FILE_ACTION_MODIFIED, FILE_ACTION_RENAMED_NEW_NAME)
+    try:
+        while not stop_event.is_set():
+            results = win32file.ReadDirectoryChangesW(handle, 65536, False, flags, None, None)
+            if not results:
+                # バッファ溢れ：取りこぼしがあるため再スキャンを要求
+                queue.add(rip_name, [], overflow=True)
+                continue
+            queue.add(rip_name, [name for action, name in results if action in wanted])
+    finally:
+        handle.close()
+
+def start_directory_watch(rip_name, path, queue, stop_event):
+    """Start a background thread delivering file events for path; raises OSError if unsupported."""
+    if win32file is not None:
+        handle = _open_win32_watch(path)
+        target, resource = _watch_win32, handle
+    elif sys.platform.startswith("linux"):
+        target, resource = _watch_inotify, _open_inotify(path)
+    else:
+        raise OSError("directory events are not supported on this platform")
+
+    def worker():
+        try:
+            target(resource, rip_name, queue, stop_event)
+        except Exception as e:
+            queue.fail(rip_name, e)
+
+    thread = threading.Thread(target=worker, name=f"watch-{rip_name}", daemon=True)
+    thread.start()
+    return thread
+
+def get_enabled_rips(config):
+    return [rip for rip, target in config.targets.items() if target.enabled]
+
+def run_watch_mode(config):
+    """Event-driven mode: clean targets as soon as new files appear, with safety rescans.
+
+    Targets whose folders cannot deliver events fall back to the polling interval.
+    """
+    general = config.general
+    polling_interval = general.polling_interval
+    rescan_interval = general.watch_rescan_interval
+    rips = get_enabled_rips(config)
+    matchers = {}
+    for rip in rips:
+        state = get_target_state(rip)
+        state.ensure_runtime(general, config.targets[rip])
+        matchers[rip] = state.policy.match
+    queue = WatchQueue(general.watch_debounce, matchers)
+    stop_event = threading.Event()
+    watched = set()
+    restartable = set()   # 監視スレッドが停止したターゲット（再スキャン時に再接続を試みる）
+
+    def try_watch(rip):
+        try:
+            start_directory_watch(rip, config.targets[rip].path, queue, stop_event)
+        except Exception as e:
+            console.warning(f"[{rip}] Directory events unavailable ({e}); using polling every {polling_interval} minutes.")
+            return
+        watched.add(rip)
+        console.summary(f"[{rip}] Watching for directory events.")
+
+    for rip in rips:
+        try_watch(rip)
+    if not watched:
+        console.warning("No folder supports directory events; falling back to polling mode.")
+        run_polling_mode(config)
         return
 
-    for filename in entries:
-        if is_valid_tiff(filename):
-            full_path = os.path.join(path, filename)
-            
-            try:
-                # ファイルの存在とサイズを一度だけチェック
-                if os.path.getsize(full_path) == 0:
-                    print(f"[{rip_name}] Skipped (Empty file): {filename}")
-                    skipped_files.append((filename, "Empty file"))
-                    continue
+    console.summary(f"Started in watch mode. Safety rescan every {rescan_interval} minutes.")
+    FreeSpaceWatchdog(lambda: config).start()
+    next_rescan = {rip: time.monotonic() for rip in rips}
+    backlog_scan = set(rips)   # 起動時の再スキャンは既存ファイルを消すだけなのでイベント判定に使わない
+    runner = create_target_runner(config)
+    try:
+        while not shutdown.requested.is_set():
+            ready, overflowed, failed = queue.take_ready()
+            for rip, error in failed.items():
+                watched.discard(rip)
+                restartable.add(rip)
+                console.warning(f"[{rip}] Directory watch stopped ({error}); using polling until it can be restored.")
+                next_rescan[rip] = time.monotonic()
+            if ready:
+                runner.run_all(config, list(ready), ready)
+            requested = kicks.take()
+            if requested:
+                boost = {rip: boosted for rip, (_kick, boosted) in requested.items() if boosted}
+                for rip, result in runner.run_all(config, list(requested), boost=boost).items():
+                    requested[rip][0].set_result(result)
+            for rip in overflowed:
+                next_rescan[rip] = time.monotonic()
 
-                # 削除を試行
-                if delete_with_retry(full_path, RETRY_MAX_ATTEMPTS, RETRY_DELAY_SECONDS):
-                    deleted_files.append(filename)
-                    print(f"[{rip_name}] Deleted: {filename}")
+            now = time.monotonic()
+            due = [rip for rip in rips if now >= next_rescan[rip]]
+            results = runner.run_all(config, due) if due else {}
+            for rip, result in results.items():
+                startup = rip in backlog_scan
+                backlog_scan.discard(rip)
+                if (rip in watched and not startup and result.deleted
+                        and not queue.events_seen.get(rip)):
+                    # 新規ファイルがあったのにイベントが一度も届いていない（SMB 等）
+                    watched.discard(rip)
+                    console.warning(f"[{rip}] Folder does not deliver events; using polling every {polling_interval} minutes.")
+                elif rip in restartable:
+                    restartable.discard(rip)
+                    try_watch(rip)
+                if rip in watched:
+                    interval = rescan_interval
                 else:
-                    print(f"[{rip_name}] Delete failed (after retry): {filename}")
-                    skipped_files.append((filename, "Delete failed"))
+                    interval = next_polling_interval(config, result)
+                next_rescan[rip] = time.monotonic() + interval * 60
 
-            except PermissionError:
-                print(f"[{rip_name}] Skipped (In use): {filename}")
-                skipped_files.append((filename, "In use"))
-            except Exception as e:
-                print(f"[{rip_name}] Error: {filename} → {e}")
-                skipped_files.append((filename, f"Error: {e}"))
+            deadlines = list(next_rescan.values())
+            event_deadline = queue.next_deadline()
+            if event_deadline is not None:
+                deadlines.append(event_deadline)
+            queue.wait(min(max(0.0, min(deadlines) - time.monotonic()), SHUTDOWN_POLL_INTERVAL))
+        kicks.cancel()
+    except KeyboardInterrupt:
+        console.summary("Watch interrupted.")
+    finally:
+        stop_event.set()
+        runner.shutdown(wait=False)
 
-    if deleted_files or skipped_files:  # 削除またはスキップしたファイルがある場合
-        log_filename = f"{now}_{rip_name}.log"
-        log_path = os.path.join(log_dir, log_filename)
-        write_detailed_log(log_path, deleted_files, skipped_files)
-    else:
-        print(f"[{rip_name}] No files to delete.")
+async def async_delete_matching_files(rip_name, path, log_dir, executor,
+                                      concurrency=DEFAULT_ASYNC_CONCURRENCY,
+                                      scan_engine=DEFAULT_SCAN_ENGINE, snapshot=None,
+                                      full_scan_interval=DEFAULT_FULL_SCAN_INTERVAL,
+                                      fs_timeout=0, breaker=None, retry_queue=None,
+                                      policy=DEFAULT_POLICY, daily_log=None, low_free_space=None):
+    """Asyncio counterpart of delete_matching_files; returns a TickResult.
 
-def write_detailed_log(log_path, deleted_files, skipped_files):
-    """Write detailed log; exit if writing fails because logs are required."""
+    Listing, stat, remove and log writes run on executor. At most concurrency
+    file operations are in flight for this target, and locked files wait for
+    their retry with asyncio.sleep instead of holding a thread. Calls against
+    the share are bounded by fs_timeout seconds (0 = no limit). Files still
+    locked after the in-tick retries are deferred through retry_queue.
+    """
+    loop = asyncio.get_running_loop()
+
+    def blocking(func, *args):
+        return loop.run_in_executor(executor, func, *args)
+
+    async def on_share(func, *args):
+        if not fs_timeout:
+            return await blocking(func, *args)
+        try:
+            return await asyncio.wait_for(blocking(func, *args), fs_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{func.__name__} did not finish within {fs_timeout:g}s") from None
+
+    if not await blocking(ensure_log_directory, log_dir):
+        console.error(f"[{rip_name}] Log directory error. Skipping operation.")
+        return TickResult(rip_name, "error")
+
+    now = datetime.now().strftime(LOG_DATETIME_FORMAT)
+    io_counts = Counter()
+    timings = Counter()
+    started = time.monotonic()
+    failure = None
     try:
-        with open(log_path, "w", encoding="utf-8") as log_file:
-            log_file.write(f"Execution time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            log_file.write("\n=== Deleted Files ===\n")
-            for name in deleted_files:
-                log_file.write(f"{name}\n")
-            log_file.write("\n=== Skipped Files ===\n")
-            for name, reason in skipped_files:
-                log_file.write(f"{name} (Reason: {reason})\n")
+        entries, listed = await on_share(open_scan, path, io_counts, scan_engine, snapshot,
+                                         full_scan_interval, None, policy)
+        timings["list"] += time.monotonic() - started
     except Exception as e:
-        print(f"Failed to write log '{log_path}': {e}")
-        sys.exit(1)
+        return await blocking(access_error_tick, rip_name, path, log_dir, now, e, snapshot, breaker,
+                              daily_log)
+    if not listed:
+        print_scan_notice(rip_name, entries, listed, None)
+    run_log = open_run_log(rip_name, log_dir, now, daily_log)
+    if retry_queue is not None:
+        retry_queue.prune()
+    entries = StopOnShutdown(entries)
+    scan_lock = asyncio.Lock()
+    semaphore = asyncio.Semaphore(concurrency)
 
-def get_config_path():
-    """Get the config.ini path relative to the executable"""
-    if getattr(sys, 'frozen', False):
-        # PyInstallerでビルドされた場合
-        config_path = os.path.join(os.path.dirname(sys.executable), "config.ini")
-    else:
-        # 通常のPython実行の場合
-        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.ini")
-    
-    if not os.path.exists(config_path):
-        raise FileNotFoundError(f"Configuration file not found: {config_path}")
-    return config_path
+    async def handle(entry):
+        if retry_queue is not None and retry_queue.is_waiting(entry.name):
+            if snapshot is not None:
+                snapshot.pending.add(entry.name)
+            return
+        final = retry_queue is None
+        for attempt in range(RETRY_MAX_ATTEMPTS):
+            if attempt:
+                metrics.inc("retries", rip_name)
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+                timings["retry_wait"] += RETRY_DELAY_SECONDS
+            async with semaphore:
+                status, reason, counts, spent = await on_share(
+                    clean_entry_counted, rip_name, entry, 1, 0,
+                    final and attempt == RETRY_MAX_ATTEMPTS - 1)
+            io_counts.update(counts)
+            timings.update(spent)
+            if status != "locked":
+                break
+        if status == "locked":
+            retry_queue.schedule(entry.name)
+            metrics.inc("retries", rip_name)
+            record_locked(rip_name, entry.name, retry_queue, run_log, snapshot)
+            return
+        if retry_queue is not None:
+            retry_queue.discard(entry.name)
+        record_outcome(entry.name, status, reason, run_log, snapshot)
 
-def load_config():
-    config = configparser.ConfigParser()
-    config_file = get_config_path()
-    config.read(config_file, encoding="utf-8")
-    validate_config(config)
-    return config
+    failed = []   # share errors; once set, no new batch is taken
 
-def run_for_rip(config, rip_name):
-    if rip_name not in config:
-        print(f"[{rip_name}] Configuration not found.")
-        return
+    async def worker():
+        while not failed:
+            async with scan_lock:
+                if failed:
+                    return
+                fetch_started = time.monotonic()
+                try:
+                    batch = await on_share(_take_batch, entries, SCAN_BATCH)
+                except OSError as e:
+                    failed.append(e)
+                    return
+                timings["list"] += time.monotonic() - fetch_started
+            if not batch:
+                return
+            # エラーが出てもバッチ内の削除は最後まで待ち、結果をすべて記録する
+            outcomes = await asyncio.gather(*(handle(entry) for entry in batch),
+                                            return_exceptions=True)
+            for outcome in outcomes:
+                if isinstance(outcome, OSError):
+                    failed.append(outcome)
+                elif isinstance(outcome, BaseException):
+                    raise outcome
+
+    # 2 本のワーカーで次のバッチの取得と削除を重ねる
+    await asyncio.gather(*(worker() for _ in range(2)))
+    if failed:
+        failure = failed[0]
+        interrupted_access(rip_name, path, failure, run_log, snapshot)
+    if entries.stopped:
+        stopped_tick(rip_name, run_log, snapshot)
+
+    return await blocking(finish_tick, rip_name, run_log, io_counts, scan_engine, breaker, failure,
+                          timings, started, low_free_space)
+
+async def async_run_for_rip(config, rip_name, executor, concurrency=DEFAULT_ASYNC_CONCURRENCY,
+                            low_free_space=None):
+    """Asyncio counterpart of run_for_rip."""
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+    settings = get_target_settings(config, rip_name)
+    if isinstance(settings, TickResult):
+        return settings
+    if not settings.breaker.allow():
+        return circuit_open_tick(rip_name, settings)
+    fs_timeout = settings.guard.timeout
+    try:
+        exists = await asyncio.wait_for(
+            loop.run_in_executor(executor, os.path.isdir, settings.path), fs_timeout or None)
+    except asyncio.TimeoutError:
+        error = TimeoutError(f"isdir did not finish within {fs_timeout:g}s")
+        return await loop.run_in_executor(executor, missing_path_tick, rip_name, settings, error)
+    if not exists:
+        return await loop.run_in_executor(executor, missing_path_tick, rip_name, settings)
+    result = await async_delete_matching_files(rip_name, settings.path, settings.log_dir, executor,
+                                               concurrency, settings.scan_engine, settings.snapshot,
+                                               settings.full_scan_interval, fs_timeout,
+                                               settings.breaker, settings.retry_queue,
+                                               settings.policy, settings.daily_log, low_free_space)
+    result.duration = time.monotonic() - started
+    record_tick_metrics(result)
+    return result
 
-    section = config[rip_name]
-    if section.getboolean("enabled", fallback=False):
-        path = section.get("path", "")
-        if not os.path.isdir(path):
-            print(f"[{rip_name}] Path does not exist: {path}")
+async def _async_target_loop(reloader, rip_name, executor, concurrency, schedule, lock):
+    while True:
+        # 設定の再読み込みで期限が早まることがあり、停止要求にも気付けるよう細かく区切って待つ
+        while time.monotonic() < schedule.deadline and not shutdown.requested.is_set():
+            await asyncio.sleep(min(schedule.deadline - time.monotonic(), SHUTDOWN_POLL_INTERVAL))
+        if shutdown.requested.is_set():
             return
+        config = reloader.config
+        async with lock:
+            result = await _async_tick(config, rip_name, executor, concurrency)
+        schedule.complete(next_polling_interval(config, result))
 
-        log_dir = config["General"].get("log_dir", "")
-        if log_dir:
-            # ログディレクトリが存在する場合、古いログを清掃
-            cleanup_old_logs(log_dir)
+async def _async_tick(config, rip_name, executor, concurrency, low_free_space=None):
+    try:
+        return await async_run_for_rip(config, rip_name, executor, concurrency, low_free_space)
+    except Exception as e:
+        console.error(f"[{rip_name}] Unexpected error: {e}")
+        return TickResult(rip_name, "error")
 
-        delete_matching_files(rip_name, path, log_dir)
-    else:
-        print(f"[{rip_name}] Disabled.")
+async def _async_kick_loop(reloader, executor, concurrency, locks):
+    """Serve control channel kicks; a target's scheduled tick and kicks never overlap."""
+    async def serve(rip, kick, boost):
+        async with locks[rip]:
+            config = reloader.config
+            limit = config.general.emergency_concurrency if boost else concurrency
+            kick.set_result(await _async_tick(config, rip, executor, limit, boost))
 
-def run_polling_mode(config):
-    interval = config["General"].getfloat("polling_interval", fallback=DEFAULT_POLLING_INTERVAL)
-    print(f"Started in polling mode. Running every {interval} minutes.")
+    busy = set()
+    tasks = set()
+    while not shutdown.requested.is_set():
+        await asyncio.sleep(KICK_POLL_INTERVAL)
+        for rip, (kick, boost) in kicks.take(exclude=busy).items():
+            busy.add(rip)
+            task = asyncio.ensure_future(serve(rip, kick, boost))
+            tasks.add(task)
+            task.add_done_callback(lambda _task, rip=rip: busy.discard(rip))
+            task.add_done_callback(tasks.discard)
+    # 実行中のキックは最後まで待つ（asyncio.run の終了で取り消されないように）
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    kicks.cancel()
+
+async def _async_config_watch(reloader, schedules):
+    while not shutdown.requested.is_set():
+        await asyncio.sleep(SHUTDOWN_POLL_INTERVAL)
+        apply_reload(reloader, schedules)
+
+async def _async_polling_main(config):
+    concurrency = config.general.async_concurrency
+    schedules = create_schedules(config)
+    reloader = ConfigReloader(config)
+    FreeSpaceWatchdog(lambda: reloader.config).start()
+    locks = {rip: asyncio.Lock() for rip in VALID_RIPS}
+    workers = len(VALID_RIPS) * concurrency + config.general.emergency_concurrency
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="io") as executor:
+        await asyncio.gather(_async_config_watch(reloader, schedules),
+                             _async_kick_loop(reloader, executor, concurrency, locks),
+                             *(_async_target_loop(reloader, rip, executor, concurrency,
+                                                  schedules[rip], locks[rip])
+                               for rip in VALID_RIPS))
+
+def run_async_polling_mode(config):
+    """Polling mode on an asyncio event loop: one long-lived coroutine per target."""
+    console.summary(polling_started_message(config, " (asyncio engine)"))
     try:
-        while True:
-            for rip in VALID_RIPS:
-                run_for_rip(config, rip)
-            time.sleep(interval * 60)
+        asyncio.run(_async_polling_main(config))
     except KeyboardInterrupt:
-        print("Polling interrupted.")
+        console.summary("Polling interrupted.")
+
+def async_clean_once(rip_name, path, log_dir, concurrency=DEFAULT_ASYNC_CONCURRENCY,
+                     scan_engine=DEFAULT_SCAN_ENGINE, retry_queue=None):
+    """Run a single asyncio pass over path (for benchmarking against delete_matching_files)."""
+    async def run():
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="io") as executor:
+            return await async_delete_matching_files(rip_name, path, log_dir, executor,
+                                                     concurrency, scan_engine,
+                                                     retry_queue=retry_queue)
+    return asyncio.run(run())
 
 def run_kick_mode(config, target):
-    if target.upper() == "ALL":
-        for rip in VALID_RIPS:
-            run_for_rip(config, rip)
-    else:
-        run_for_rip(config, target)
+    """Run target (a RIP or ALL) now: through the running instance if there is one."""
+    try:
+        results = request_kick(target)
+    except Exception as e:
+        console.error(f"Kick failed: {e}")
+        return 1
+    if results is not None:
+        for rip, result in results.items():
+            console.summary(f"[{rip}] {result['status']}: deleted {result['deleted']}, skipped "
+                            f"{result['skipped']} in {result['duration']:.1f}s (by the running instance).")
+        return 0
+    # request_kick がインスタンスロックを取ったので、実行中に常駐プロセスは起動できない
+    start_services(config)
+    try:
+        if target.upper() == "ALL":
+            runner = create_target_runner(config)
+            try:
+                started = time.monotonic()
+                results = runner.run_all(config, VALID_RIPS)
+                print_tick_summary(results, time.monotonic() - started)
+            finally:
+                runner.shutdown()
+        else:
+            run_for_rip(config, target)
+    finally:
+        flush_state()   # トレンドの書き込みスレッドやメトリクスファイルを終了前に書き出す
 
-def delete_with_retry(file_path, max_retries=3, retry_delay=1):
-    """リトライ機能付きファイル削除"""
+def delete_with_retry(file_path, max_retries=3, retry_delay=1, timings=None):
+    """リトライ機能付きファイル削除（待ち時間は timings["retry_wait"] に加算）"""
     for attempt in range(max_retries):
         try:
             os.remove(file_path)
@@ -236,6 +2783,8 @@ def delete_with_retry(file_path, max_retries=3, retry_delay=1):
         except PermissionError:
             if attempt < max_retries - 1:
                 time.sleep(retry_delay)
+                if timings is not None:
+                    timings["retry_wait"] += retry_delay
                 continue
             # 最終失敗時は例外を再スローせず False を返す（呼び出し側でスキップ処理する）
             return False
@@ -257,39 +2806,1170 @@ def validate_config(config):
     interval = config["General"].getfloat("polling_interval")
     if interval <= 0:
         raise ValueError("polling_interval must be a positive value")
+    config["General"].getboolean("adaptive_interval", fallback=False)   # 不正な値は ValueError
+    low = config["General"].getfloat("min_polling_interval", fallback=DEFAULT_MIN_POLLING_INTERVAL)
+    high = config["General"].getfloat("max_polling_interval", fallback=DEFAULT_MAX_POLLING_INTERVAL)
+    if low <= 0 or high < low:
+        raise ValueError("min_polling_interval must be positive and not above max_polling_interval")
+    for rip in VALID_RIPS:
+        if rip in config and config[rip].getfloat("polling_interval", fallback=interval) <= 0:
+            raise ValueError(f"polling_interval must be a positive value in {rip}")
+    if config["General"].get("overrun_policy", DEFAULT_OVERRUN_POLICY) not in OVERRUN_POLICIES:
+        raise ValueError(f"overrun_policy must be one of: {', '.join(OVERRUN_POLICIES)}")
+    if config["General"].getfloat("startup_jitter", fallback=0.0) < 0:
+        raise ValueError("startup_jitter must not be negative")
+
+    scan_engine = config["General"].get("scan_engine", DEFAULT_SCAN_ENGINE)
+    if scan_engine not in SCAN_ENGINES:
+        raise ValueError(f"scan_engine must be one of: {', '.join(SCAN_ENGINES)}")
+
+    config["General"].getboolean("incremental_scan", fallback=True)   # 不正な値は ValueError
+    if config["General"].getint("target_workers", fallback=DEFAULT_TARGET_WORKERS) < 1:
+        raise ValueError("target_workers must be at least 1")
+    for section in [config["General"]] + [config[rip] for rip in VALID_RIPS if rip in config]:
+        if section.getint("delete_concurrency", fallback=DEFAULT_DELETE_CONCURRENCY) < 1:
+            raise ValueError(f"delete_concurrency must be at least 1 in {section.name}")
+    if config["General"].getfloat("fs_timeout", fallback=DEFAULT_FS_TIMEOUT) < 0:
+        raise ValueError("fs_timeout must not be negative")
+    if config["General"].getint("breaker_threshold", fallback=DEFAULT_BREAKER_THRESHOLD) < 1:
+        raise ValueError("breaker_threshold must be at least 1")
+    for key, default in (("breaker_backoff", DEFAULT_BREAKER_BACKOFF),
+                         ("breaker_max_backoff", DEFAULT_BREAKER_MAX_BACKOFF),
+                         ("retry_backoff", RETRY_DELAY_SECONDS),
+                         ("retry_max_backoff", DEFAULT_RETRY_MAX_BACKOFF)):
+        if config["General"].getfloat(key, fallback=default) <= 0:
+            raise ValueError(f"{key} must be a positive value")
+    if config["General"].getint("log_retention_days", fallback=DEFAULT_LOG_RETENTION_DAYS) < 1:
+        raise ValueError("log_retention_days must be at least 1")
+    if config["General"].getfloat("log_compress_after", fallback=0) < 0:
+        raise ValueError("log_compress_after must not be negative")
+    if config["General"].getfloat("log_retention_interval",
+                                  fallback=DEFAULT_LOG_RETENTION_INTERVAL) <= 0:
+        raise ValueError("log_retention_interval must be a positive value")
+    config["General"].getboolean("log_day_buckets", fallback=False)   # 不正な値は ValueError
+    config["General"].getboolean("event_log", fallback=False)
+    if not 0 <= config["General"].getint("metrics_port", fallback=0) <= 65535:
+        raise ValueError("metrics_port must be between 0 and 65535")
+    config["General"].getboolean("control", fallback=True)   # 不正な値は ValueError
+    if not 0 <= config["General"].getint("control_port", fallback=0) <= 65535:
+        raise ValueError("control_port must be between 0 and 65535")
+    if config["General"].get("console_level", DEFAULT_CONSOLE_LEVEL) not in CONSOLE_LEVELS:
+        raise ValueError(f"console_level must be one of: {', '.join(CONSOLE_LEVELS)}")
+    if config["General"].get("log_mode", DEFAULT_LOG_MODE) not in LOG_MODES:
+        raise ValueError(f"log_mode must be one of: {', '.join(LOG_MODES)}")
+    if config["General"].get("engine", DEFAULT_ENGINE) not in ENGINES:
+        raise ValueError(f"engine must be one of: {', '.join(ENGINES)}")
+    if config["General"].getint("async_concurrency", fallback=DEFAULT_ASYNC_CONCURRENCY) < 1:
+        raise ValueError("async_concurrency must be at least 1")
+    if config["General"].getint("emergency_concurrency", fallback=DEFAULT_EMERGENCY_CONCURRENCY) < 1:
+        raise ValueError("emergency_concurrency must be at least 1")
+    for section in [config["General"]] + [config[rip] for rip in VALID_RIPS if rip in config]:
+        if section.getfloat("min_free_mb", fallback=0.0) < 0:
+            raise ValueError(f"min_free_mb must not be negative in {section.name}")
+        if not 0 <= section.getfloat("min_free_percent", fallback=0.0) < 100:
+            raise ValueError(f"min_free_percent must be between 0 and 100 in {section.name}")
+    for key, default in (("full_scan_interval", DEFAULT_FULL_SCAN_INTERVAL),
+                         ("watch_debounce", DEFAULT_WATCH_DEBOUNCE),
+                         ("watch_rescan_interval", DEFAULT_WATCH_RESCAN_INTERVAL),
+                         ("drain_timeout", DEFAULT_DRAIN_TIMEOUT),
+                         ("free_space_interval", DEFAULT_FREE_SPACE_INTERVAL)):
+        if config["General"].getfloat(key, fallback=default) <= 0:
+            raise ValueError(f"{key} must be a positive value")
     
     for rip in VALID_RIPS:
         if rip in config and config[rip].getboolean("enabled", False):
             if "path" not in config[rip]:
                 raise ValueError(f"'path' is required in {rip}")
+            compile_policy(config, rip)
 
-def cleanup_old_logs(log_dir, days_to_keep=30):
-    """古いログファイルを削除"""
-    if not log_dir:
-        return
-    if not os.path.isdir(log_dir):
+    for section_name in config.sections():
+        if section_name.startswith(RULE_SECTION_PREFIX):
+            section = config[section_name]
+            _parse_rule(section, section_name[len(RULE_SECTION_PREFIX):])
+            for target in section.get("targets", "").split(","):
+                if target.strip() and target.strip() not in VALID_RIPS:
+                    raise ValueError(f"Unknown target '{target.strip()}' in {section_name}")
+
+def log_name_time(name):
+    """Start and end of the period a log (or day bucket) covers, from its name.
+
+    Per-run logs cover the instant in their LOG_DATETIME_FORMAT prefix; daily
+    logs and day buckets cover their whole day. Returns None for other names.
+    """
+    for fmt, length, span in ((LOG_DATETIME_FORMAT, 15, timedelta(0)),
+                              (DAILY_LOG_DATE_FORMAT, 8, timedelta(days=1))):
+        stamp = name[:length]
+        if len(name) > length and name[length] != "_":
+            continue
+        try:
+            started = datetime.strptime(stamp, fmt)
+        except ValueError:
+            continue
+        return started, started + span
+    return None
+
+class LogRetention:
+    """Removes and optionally compresses old logs in log_dir on its own cadence.
+
+    Ages come from the timestamps in the file names (see log_name_time), so
+    no stat is needed. Logs are kept in heaps ordered by the end of the
+    period they cover; log_dir is listed once at start and again every
+    LOG_RETENTION_RESCAN seconds, and new logs are added by note() as they
+    are written. A pass therefore only pops the entries that are due:
+
+    - after days_to_keep days the log is removed,
+    - after compress_after days (0 = never) it is gzipped to <name>.gz,
+    - with day_buckets, logs are written to log_dir/<YYYYMMDD>/ and an
+      expired day is removed as one folder.
+    """
+
+    def __init__(self, log_dir, days_to_keep=DEFAULT_LOG_RETENTION_DAYS, compress_after=0,
+                 day_buckets=False, interval=DEFAULT_LOG_RETENTION_INTERVAL * 60):
+        self.log_dir = os.path.normpath(log_dir)   # 末尾の区切り文字があってもバケット判定がずれないように
+        self.days_to_keep = days_to_keep
+        self.compress_after = compress_after
+        self.day_buckets = day_buckets
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._expire = []     # heap of (end time, path, is_bucket)
+        self._compress = []   # heap of (end time, path)
+        self._known = set()
+        self._listed_at = None
+        self._noted = None    # logs noted while a rescan lists log_dir
+        self._stop = threading.Event()
+        self._thread = None
+
+    def path_for(self, name):
+        if self.day_buckets:
+            return os.path.join(self.log_dir, name[:8], name)
+        return os.path.join(self.log_dir, name)
+
+    def note(self, path):
+        """Index a log that is being written."""
+        path = os.path.normpath(path)
+        with self._lock:
+            self._add(path)
+            if self._noted is not None:
+                self._noted.append(path)   # 一覧の入れ替え後も残す
+
+    def _add(self, path, is_bucket=False):
+        if path in self._known:
+            return
+        period = log_name_time(os.path.basename(path))
+        if period is None:
+            return
+        ends = period[1].timestamp()
+        self._known.add(path)
+        if not is_bucket and os.path.dirname(path) != self.log_dir:
+            self._add(os.path.dirname(path), True)   # バケット内のログはフォルダごと期限切れにする
+        else:
+            heapq.heappush(self._expire, (ends, path, is_bucket))
+        if self.compress_after and not is_bucket and not path.endswith(".gz"):
+            heapq.heappush(self._compress, (ends, path))
+
+    def _rescan(self):
+        """List log_dir (and its day buckets when compressing) into fresh heaps.
+
+        The listing runs without the lock, so note() from a tick never waits
+        for the share; logs noted meanwhile are kept when the heaps are swapped.
+        """
+        with self._lock:
+            self._noted = []
+        listed = []   # (path, is_bucket)
+        unparsed = []
+        try:
+            for entry in os.scandir(self.log_dir):
+                if entry.is_dir():
+                    if log_name_time(entry.name) is None:
+                        continue
+                    listed.append((entry.path, True))
+                    if self.compress_after:
+                        for child in os.scandir(entry.path):
+                            if child.name.endswith((".log", EVENT_LOG_SUFFIX)):
+                                listed.append((child.path, False))
+                elif entry.name.endswith((".log", ".log.gz", EVENT_LOG_SUFFIX, EVENT_LOG_SUFFIX + ".gz")):
+                    if log_name_time(entry.name) is None:
+                        unparsed.append(entry)
+                    else:
+                        listed.append((entry.path, False))
+        except Exception:
+            with self._lock:
+                self._noted = None
+            raise
+        with self._lock:
+            noted, self._noted = self._noted, None
+            self._expire, self._compress, self._known = [], [], set()
+            for path, is_bucket in listed:
+                self._add(path, is_bucket)
+            for path in noted:
+                self._add(path)
+        return unparsed
+
+    def run_once(self, now=None):
+        """One retention pass; returns (removed, compressed) counts."""
+        now = (now or datetime.now()).timestamp()
+        expire_before = now - (self.days_to_keep + 1) * 86400
+        removed = compressed = 0
+        unparsed = []
+        if self._listed_at is None or time.monotonic() - self._listed_at >= LOG_RETENTION_RESCAN:
+            unparsed = self._rescan()
+            self._listed_at = time.monotonic()
+        with self._lock:
+            due = []
+            while self._expire and self._expire[0][0] <= expire_before:
+                due.append(heapq.heappop(self._expire))
+            compress_before = now - self.compress_after * 86400
+            to_compress = []
+            while self.compress_after and self._compress and self._compress[0][0] <= compress_before:
+                to_compress.append(heapq.heappop(self._compress)[1])
+        for _ends, path, is_bucket in due:
+            removed += self._remove(path, is_bucket)
+        for entry in unparsed:
+            # 名前に日時がないログは従来どおり作成日時で判断する
+            try:
+                if entry.stat().st_ctime <= expire_before:
+                    removed += self._remove(entry.path, False)
+            except OSError:
+                continue
+        for path in to_compress:
+            compressed += self._gzip(path)
+        return removed, compressed
+
+    def _remove(self, path, is_bucket):
+        with self._lock:
+            self._known.discard(path)
+        try:
+            if is_bucket:
+                shutil.rmtree(path)   # 1 日分をまとめて削除
+            else:
+                for candidate in (path, path + ".gz"):
+                    if os.path.exists(candidate):
+                        os.remove(candidate)
+            return 1
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            console.warning(f"Failed to delete old log: {os.path.basename(path)} → {e}")
+            return 0
+
+    def _gzip(self, path):
+        if path.endswith(".gz") or not os.path.exists(path):
+            return 0
+        temp_path = path + ".gz.tmp"
+        try:
+            with open(path, "rb") as source, gzip.open(temp_path, "wb") as target:
+                shutil.copyfileobj(source, target)
+            shutil.copystat(path, temp_path)
+            os.replace(temp_path, path + ".gz")
+            os.remove(path)
+            return 1
+        except OSError as e:
+            console.warning(f"Failed to compress log: {os.path.basename(path)} → {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return 0
+
+    def start(self):
+        """Run passes every interval seconds on a background thread."""
+        self._thread = threading.Thread(target=self._run, name="log-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                removed, compressed = self.run_once()
+                if removed or compressed:
+                    console.info(f"Log retention: removed {removed}, compressed {compressed} old log(s).")
+            except OSError as e:
+                console.warning(f"Failed to list log directory: {e}")
+                self._listed_at = None
+            self._stop.wait(self.interval)
+
+_log_retentions = {}
+
+def get_log_retention(log_dir):
+    """The running LogRetention for log_dir, or None."""
+    return _log_retentions.get(log_dir)
+
+def start_log_retention(config):
+    """Start the retention manager for the configured log_dir."""
+    general = config["General"]
+    log_dir = general.get("log_dir", "")
+    if not log_dir or log_dir in _log_retentions:
+        return _log_retentions.get(log_dir)
+    retention = LogRetention(
+        log_dir,
+        general.getint("log_retention_days", fallback=DEFAULT_LOG_RETENTION_DAYS),
+        general.getfloat("log_compress_after", fallback=0),
+        general.getboolean("log_day_buckets", fallback=False),
+        general.getfloat("log_retention_interval", fallback=DEFAULT_LOG_RETENTION_INTERVAL) * 60)
+    _log_retentions[log_dir] = retention
+    retention.start()
+    return retention
+
+def cleanup_old_logs(log_dir, days_to_keep=DEFAULT_LOG_RETENTION_DAYS):
+    """古いログファイルを削除（1 回分の保持処理）"""
+    if not log_dir or not os.path.isdir(log_dir):
         # ログディレクトリがなければ何もしない（外部ログ解析ツールとの整合性を維持）
         return
-    current_time = datetime.now()
     try:
-        entries = os.listdir(log_dir)
-    except Exception as e:
-        print(f"Failed to list log directory: {e}")
-        return
+        LogRetention(log_dir, days_to_keep).run_once()
+    except OSError as e:
+        console.warning(f"Failed to list log directory: {e}")
+
+_event_log_dirs = set()
+
+def iter_log_sources(log_dir):
+    """Yield DirEntry objects for run logs and event streams in log_dir and its day buckets."""
+    suffixes = (".log", ".log.gz", EVENT_LOG_SUFFIX, EVENT_LOG_SUFFIX + ".gz")
+    for entry in os.scandir(log_dir):
+        if entry.is_dir():
+            if log_name_time(entry.name) is not None:
+                yield from (child for child in os.scandir(entry.path) if child.name.endswith(suffixes))
+        elif entry.name.endswith(suffixes):
+            yield entry
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+def parse_log_source(path, hold_last=False):
+    """Parse one run log or event stream into runs for the log index.
+
+    Returns (path, runs, held): runs is a list of (run, target, events)
+    with events as (timestamp, file, status, reason) tuples; held is True
+    when an unfinished run was left out (see LOG_INDEX_SETTLE). Run at the
+    top level so it can be used from a process pool.
+    """
+    runs = []
+    held = False
+    name = os.path.basename(path)
+    if name.endswith(".gz"):
+        name = name[:-3]
+    if name.endswith(EVENT_LOG_SUFFIX):
+        by_run = {}
+        finished = set()
+        with _open_text(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue   # 書きかけの行
+                run = record.get("run")
+                if record.get("event") == "end":
+                    finished.add(run)
+                    continue
+                ts = datetime.fromisoformat(record["ts"]).timestamp()
+                by_run.setdefault(run, (record.get("target"), []))[1].append(
+                    (ts, record.get("file"), record.get("event"), record.get("reason")))
+        for run in finished:
+            target, events = by_run.get(run, (None, []))
+            runs.append((run, target, events))
+        held = len(by_run.keys() - finished) > 0
+        return path, runs, held
+
+    period = log_name_time(name)
+    target = name.rsplit("_", 1)[-1][:-len(".log")]   # <timestamp>_<RIP>.log
+    current = None
+    section = None
+    with _open_text(path) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("Execution time: "):
+                started = line[len("Execution time: "):]
+                try:
+                    ts = datetime.strptime(started, DETAILED_DATETIME_FORMAT).timestamp()
+                except ValueError:
+                    ts = period[0].timestamp() if period else 0.0
+                current = (log_run_id(name, started), target, [])
+                runs.append(current)
+                section = None
+            elif line == "=== Deleted Files ===":
+                section = "deleted"
+            elif line == "=== Skipped Files ===":
+                section = "skipped"
+            elif line == "=== Summary ===":
+                section = None
+            elif not line or current is None or line.startswith("##### "):
+                continue
+            elif section == "deleted":
+                current[2].append((ts, line, "deleted", None))
+            elif section == "skipped":
+                file, _, reason = line.partition(" (Reason: ")
+                status = "note" if file in LOG_NOTES else "skipped"
+                current[2].append((ts, file, status, reason[:-1] if reason else None))
+    if hold_last and runs:
+        runs.pop()
+        held = True
+    return path, runs, held
+
+class LogIndex:
+    """SQLite index of run log events by target, hour and file name.
+
+    refresh() parses logs that are new or have grown since the last call
+    (in a process pool when there are many) and adds their finished runs;
+    each run is stored once, whether it comes from the event stream or the
+    human-readable log.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, size INTEGER);
+        CREATE TABLE IF NOT EXISTS runs (run TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS events (
+            ts REAL, hour INTEGER, target TEXT, file TEXT COLLATE NOCASE, status TEXT, reason TEXT);
+        CREATE INDEX IF NOT EXISTS events_file ON events (file);
+        CREATE INDEX IF NOT EXISTS events_target_hour ON events (target, hour);
+    """
+
+    def __init__(self, index_path):
+        self.conn = sqlite3.connect(index_path)
+        self.conn.executescript(self.SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def refresh(self, log_dir):
+        """Index new or changed logs in log_dir; returns the number of runs added."""
+        known = dict(self.conn.execute("SELECT path, size FROM sources"))
+        now = time.time()
+        todo = []
+        for entry in iter_log_sources(log_dir):
+            stat = entry.stat()
+            if known.get(entry.path) == stat.st_size:
+                continue
+            todo.append((entry.path, stat.st_size, now - stat.st_mtime < LOG_INDEX_SETTLE))
+        # イベントストリームを先に取り込み、同じ実行の人間向けログは重複として捨てる
+        todo.sort(key=lambda item: (not item[0].endswith((EVENT_LOG_SUFFIX, EVENT_LOG_SUFFIX + ".gz")),
+                                    item[0]))
+        paths = [item[0] for item in todo]
+        holds = [item[2] for item in todo]
+        if len(todo) >= LOG_INDEX_POOL_MIN:
+            with ProcessPoolExecutor() as pool:
+                parsed = list(pool.map(parse_log_source, paths, holds, chunksize=8))
+        else:
+            parsed = [parse_log_source(path, hold) for path, hold in zip(paths, holds)]
+        added = 0
+        with self.conn:
+            for (path, runs, held), (_path, size, _hold) in zip(parsed, todo):
+                for run, target, events in runs:
+                    if self.conn.execute("INSERT OR IGNORE INTO runs VALUES (?)", (run,)).rowcount:
+                        added += 1
+                        self.conn.executemany(
+                            "INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)",
+                            ((ts, int(ts // 3600), target, file, status, reason)
+                             for ts, file, status, reason in events))
+                if not held:
+                    self.conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (path, size))
+        return added
+
+    def query(self, pattern, target=None, since=None, until=None):
+        """Events for a file name; * in pattern matches any characters."""
+        if "*" in pattern:
+            clause, value = "file LIKE ?", pattern.replace("*", "%")
+        else:
+            clause, value = "file = ?", pattern
+        sql, params = self._where(f"SELECT ts, target, status, file, reason FROM events WHERE {clause}",
+                                  [value], target, since, until)
+        return self.conn.execute(sql + " ORDER BY ts", params).fetchall()
+
+    def stats(self, target=None, since=None, until=None, by="hour"):
+        """(bucket start, target, deleted, skipped) rows per hour or day."""
+        size = 3600 if by == "hour" else 86400
+        sql, params = self._where(
+            f"SELECT CAST(ts / {size} AS INTEGER) * {size}, target, "
+            "SUM(status = 'deleted'), SUM(status = 'skipped') FROM events WHERE 1",
+            [], target, since, until)
+        return self.conn.execute(sql + " GROUP BY 1, 2 ORDER BY 1, 2", params).fetchall()
+
+    @staticmethod
+    def _where(sql, params, target, since, until):
+        if target:
+            sql += " AND target = ?"
+            params.append(target)
+        if since is not None:
+            sql += " AND hour >= ? AND ts >= ?"
+            params += [int(since // 3600), since]
+        if until is not None:
+            sql += " AND hour <= ? AND ts < ?"
+            params += [int(until // 3600), until]
+        return sql, params
+
+def parse_query_args(argv):
+    parser = argparse.ArgumentParser(prog=APP_NAME, description="Search and summarize run logs.")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--query", metavar="FILE", help="file name to look up (* = wildcard)")
+    mode.add_argument("--stats", action="store_true", help="deleted / skipped counts per period")
+    parser.add_argument("--target", choices=VALID_RIPS)
+    parser.add_argument("--since", help="YYYY-MM-DD[ HH:MM]")
+    parser.add_argument("--until", help="YYYY-MM-DD[ HH:MM] (exclusive)")
+    parser.add_argument("--by", choices=("hour", "day"), default="hour", help="--stats period")
+    return parser.parse_args(argv)
+
+def _parse_when(value):
+    if value is None:
+        return None
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid date: {value}")
+
+def run_log_query(config, argv):
+    """--query / --stats: refresh the log index from log_dir, then answer from it."""
+    args = parse_query_args(argv)
+    since, until = _parse_when(args.since), _parse_when(args.until)
+    general = config["General"]
+    log_dir = general.get("log_dir", "")
+    index = LogIndex(os.path.join(get_app_dir(), general.get("log_index", DEFAULT_LOG_INDEX)))
+    try:
+        started = time.monotonic()
+        try:
+            added = index.refresh(log_dir)
+        except OSError as e:
+            print(f"Failed to read log directory '{log_dir}': {e} (answering from the existing index)")
+            added = 0
+        refreshed = time.monotonic()
+        if args.query:
+            rows = index.query(args.query, args.target, since, until)
+            for ts, target, status, file, reason in rows:
+                when = datetime.fromtimestamp(ts).strftime(DETAILED_DATETIME_FORMAT)
+                print(f"{when}  {target}  {status:<8} {file}" + (f"  ({reason})" if reason else ""))
+            print(f"{len(rows)} event(s) found.", end="")
+        else:
+            rows = index.stats(args.target, since, until, args.by)
+            fmt = "%Y-%m-%d %H:00" if args.by == "hour" else "%Y-%m-%d"
+            total = 0
+            for bucket, target, deleted, skipped in rows:
+                total += deleted
+                print(f"{datetime.fromtimestamp(bucket).strftime(fmt)}  {target}  "
+                      f"deleted {deleted:>7}  skipped {skipped:>5}")
+            periods = len({bucket for bucket, *_ in rows})
+            average = total / periods if periods else 0
+            print(f"{total} file(s) deleted; {average:.1f} per active {args.by}.", end="")
+        print(f" Index updated with {added} run(s) in {refreshed - started:.2f}s, "
+              f"lookup {(time.monotonic() - refreshed) * 1000:.0f} ms.")
+    finally:
+        index.close()
+    return 0
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics (Prometheus text) and /metrics.json."""
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = metrics.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            body = json.dumps(metrics.as_dict(), indent=2).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass   # アクセスごとのコンソール出力はしない
+
+def write_metrics_textfile(path):
+    """Write the Prometheus text to path atomically (node_exporter textfile collector)."""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(metrics.render_prometheus())
+    os.replace(temp_path, path)
+
+def _metrics_textfile_loop(path):
+    while True:
+        time.sleep(METRICS_TEXTFILE_INTERVAL)
+        try:
+            write_metrics_textfile(path)
+        except OSError as e:
+            console.warning(f"Failed to write metrics file '{path}': {e}")
+
+_metrics_textfile = None
+
+def start_metrics(config):
+    """Start the metrics endpoint and textfile writer when configured (both off by default)."""
+    general = config["General"]
+    port = general.getint("metrics_port", fallback=0)
+    if port:
+        address = general.get("metrics_address", DEFAULT_METRICS_ADDRESS)
+        try:
+            server = ThreadingHTTPServer((address, port), MetricsHandler)
+        except OSError as e:
+            console.error(f"Failed to start metrics endpoint on {address}:{port}: {e}")
+        else:
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+            console.summary(f"Metrics available at http://{address}:{port}/metrics (and /metrics.json).")
+    global _metrics_textfile
+    textfile = general.get("metrics_textfile", "")
+    if textfile:
+        _metrics_textfile = textfile
+        threading.Thread(target=_metrics_textfile_loop, args=(textfile,), name="metrics-textfile",
+                         daemon=True).start()
+
+class KickQueue:
+    """Kick requests from the control channel, coalesced per target.
+
+    A target has at most one kick waiting to start; further requests for it
+    share that kick's Future and receive the same TickResult. A kick that
+    arrives while the target is running waits for a new tick, so files that
+    appeared after the running scan started are still covered.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}   # rip_name -> Future
+        self._boost = {}     # rip_name -> LowFreeSpace that asked for the waiting kick
+        self._event = threading.Event()
+
+    def request(self, rip_name, boost=None):
+        """Ask for a tick of rip_name; returns a Future for its TickResult.
 
-    for filename in entries:
-        if filename.endswith('.log'):
-            file_path = os.path.join(log_dir, filename)
+        With boost (a LowFreeSpace) the tick deletes with emergency_concurrency.
+        """
+        with self._lock:
+            future = self._pending.get(rip_name)
+            if future is None:
+                future = self._pending[rip_name] = Future()
+            else:
+                console.info(f"[{rip_name}] Kick joined one that is already waiting.")
+            if boost:
+                self._boost[rip_name] = boost
+            self._event.set()
+            return future
+
+    def take(self, exclude=()):
+        """Remove and return the waiting kicks as {rip_name: (Future, boost)}, except those in exclude."""
+        with self._lock:
+            taken = {rip: (future, self._boost.get(rip)) for rip, future in self._pending.items()
+                     if rip not in exclude}
+            for rip in taken:
+                del self._pending[rip]
+                self._boost.pop(rip, None)
+            if not self._pending:
+                self._event.clear()
+            return taken
+
+    def wait(self, timeout):
+        """Sleep up to timeout seconds, waking early when a kick arrives."""
+        self._event.wait(timeout)
+
+    def cancel(self):
+        """Answer kicks that will not run because the process is stopping."""
+        for rip, (future, _boost) in self.take().items():
+            future.set_result(TickResult(rip, "stopped"))
+
+kicks = KickQueue()
+
+class InstanceLock:
+    """Exclusive lock on a file next to the executable, held while an instance runs."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """Take the lock; returns False when another process holds it."""
+        f = open(self.path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            elif msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()   # ファイルを閉じるとロックも解放される
+            self._file = None
+
+class ControlHandler(BaseHTTPRequestHandler):
+    """POST /kick/<RIP|ALL> on the running instance; answers with the tick results as JSON."""
+    token = ""
+
+    def do_POST(self):
+        if not secrets.compare_digest(self.headers.get("X-Token", ""), self.token):
+            self.send_error(403)
+            return
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "kick":
+            self.send_error(404)
+            return
+        target = parts[1].upper()
+        if target != "ALL" and target not in VALID_RIPS:
+            self.send_error(400, f"Unknown target: {parts[1]}")
+            return
+        rips = VALID_RIPS if target == "ALL" else [target]
+        console.info(f"Kick requested for {target}.")
+        requested = [(rip, kicks.request(rip)) for rip in rips]
+        results = {}
+        for rip, future in requested:
             try:
-                file_time = datetime.fromtimestamp(os.path.getctime(file_path))
-            except Exception:
-                # ファイルメタ情報取得に失敗したらスキップ
+                result = future.result(timeout=KICK_TIMEOUT)
+            except FuturesTimeoutError:
+                result = TickResult(rip, "busy")
+            results[rip] = {name: getattr(result, name) for name in TickResult.__slots__}
+        body = json.dumps({"results": results}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_instance_lock = None
+
+def start_control(config):
+    """Take the single-instance lock and open the local control channel.
+
+    Returns False when another instance already holds the lock. The port and
+    a token for the channel are written to CONTROL_FILE for --kick clients.
+    """
+    global _instance_lock
+    app_dir = get_app_dir()
+    lock = InstanceLock(os.path.join(app_dir, INSTANCE_LOCK_FILE))
+    if not lock.acquire():
+        return False
+    _instance_lock = lock
+    general = config["General"]
+    if not general.getboolean("control", fallback=True):
+        return True
+    ControlHandler.token = secrets.token_hex(16)
+    try:
+        server = ThreadingHTTPServer((CONTROL_ADDRESS, general.getint("control_port", fallback=0)),
+                                     ControlHandler)
+    except OSError as e:
+        console.error(f"Failed to open the control channel: {e}")
+        return True
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="control", daemon=True).start()
+    control_path = os.path.join(app_dir, CONTROL_FILE)
+    with open(control_path, "w", encoding="utf-8") as f:
+        json.dump({"pid": os.getpid(), "port": server.server_address[1],
+                   "token": ControlHandler.token}, f)
+    atexit.register(_remove_control_file, control_path)
+    console.info(f"Control channel listening on {CONTROL_ADDRESS}:{server.server_address[1]}.")
+    return True
+
+def _remove_control_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def request_kick(target):
+    """Ask the running instance to run target now.
+
+    Returns {rip_name: result dict}, or None when no instance is running
+    (the caller then runs the target itself). In that case this process
+    keeps the instance lock until it exits, so no instance can start and
+    clean the same folders meanwhile. Raises when an instance is running but
+    cannot be reached.
+    """
+    global _instance_lock
+    app_dir = get_app_dir()
+    lock = InstanceLock(os.path.join(app_dir, INSTANCE_LOCK_FILE))
+    if lock.acquire():
+        _instance_lock = lock
+        return None
+    # 常駐中のインスタンスがある間は、同じフォルダを二重に処理しないよう単独実行しない
+    try:
+        with open(os.path.join(app_dir, CONTROL_FILE), encoding="utf-8") as f:
+            control = json.load(f)
+    except (OSError, ValueError):
+        raise RuntimeError("the running instance has no control channel (control = false?)")
+    request = urllib.request.Request(f"http://{CONTROL_ADDRESS}:{control['port']}/kick/{target}",
+                                     data=b"", method="POST", headers={"X-Token": control["token"]})
+    with urllib.request.urlopen(request, timeout=KICK_TIMEOUT + 30) as response:
+        return json.load(response)["results"]
+
+LowFreeSpace = namedtuple("LowFreeSpace", "free limit")   # bytes; why a cleanup was started
+
+def free_space_limit(target, total):
+    """Free bytes below which target's volume gets a low free space cleanup (0 = never)."""
+    return max(target.min_free_mb * 1e6, total * target.min_free_percent / 100)
+
+class FreeSpaceWatchdog:
+    """Watches the free space on each target's volume between polls.
+
+    One light thread per target calls shutil.disk_usage every
+    free_space_interval seconds. Below the target's min_free_mb /
+    min_free_percent it asks for an immediate cleanup of that target through
+    the kick queue, deleting with emergency_concurrency, and logs the space
+    reclaimed. While space stays low the next cleanup waits
+    FREE_SPACE_RETRIGGER seconds.
+    """
+
+    def __init__(self, get_config):
+        self._get_config = get_config   # returns the running AppConfig (follows reloads)
+
+    def start(self):
+        for rip in VALID_RIPS:
+            threading.Thread(target=self._run, args=(rip,), name=f"free-space-{rip}",
+                             daemon=True).start()
+
+    def _run(self, rip_name):
+        not_before = 0.0
+        while not shutdown.requested.wait(self._get_config().general.free_space_interval):
+            target = self._get_config().targets.get(rip_name)
+            if target is None or not target.enabled:
+                continue
+            if not target.min_free_mb and not target.min_free_percent:
+                continue
+            try:
+                usage = shutil.disk_usage(target.path)
+            except OSError:
+                continue   # 到達できない場合は通常のティックが報告する
+            metrics.set("free_bytes", rip_name, usage.free)
+            limit = free_space_limit(target, usage.total)
+            if usage.free >= limit or time.monotonic() < not_before:
                 continue
-            if (current_time - file_time).days > days_to_keep:
+            if not self.cleanup(rip_name, target.path, usage.free, limit):
+                not_before = time.monotonic() + FREE_SPACE_RETRIGGER
+
+    def cleanup(self, rip_name, path, free, limit):
+        """Run a low free space cleanup; returns True when enough space was freed."""
+        metrics.inc("free_space_cleanups", rip_name)
+        console.warning(f"[{rip_name}] Free space {free / 1e6:.0f} MB is below {limit / 1e6:.0f} MB; "
+                        f"cleaning now.")
+        result = kicks.request(rip_name, boost=LowFreeSpace(free, limit)).result()
+        try:
+            free = shutil.disk_usage(path).free
+        except OSError:
+            free = 0
+        metrics.set("free_bytes", rip_name, free)
+        console.summary(f"[{rip_name}] Low free space cleanup {result.status}: deleted {result.deleted} "
+                        f"file(s), reclaimed {result.reclaimed / 1e6:.1f} MB; "
+                        f"{free / 1e6:.0f} MB free now.")
+        return free >= limit
+
+class TrendRing:
+    """Fixed-size ring of TREND_FIELDS records in one array('d').
+
+    With rollup ("hour" / "day") a record falling into the same local hour
+    or day as the newest slot is merged into it (sums; backlog is the
+    latest value) instead of taking a new slot.
+    """
+    WIDTH = len(TREND_FIELDS)
+
+    def __init__(self, slots, rollup=None):
+        self.slots = slots
+        self.rollup = rollup
+        self.data = array.array("d", bytes(8 * slots * self.WIDTH))
+        self.head = -1    # slot of the newest record
+        self.count = 0
+
+    def add(self, record):
+        """Add or merge a record; returns the slot written."""
+        record = list(record)
+        if self.rollup:
+            stamp = datetime.fromtimestamp(record[0]).replace(minute=0, second=0, microsecond=0)
+            if self.rollup == "day":
+                stamp = stamp.replace(hour=0)
+            record[0] = stamp.timestamp()
+            base = self.head * self.WIDTH
+            if self.count and self.data[base] == record[0]:
+                for i in range(1, self.WIDTH - 1):
+                    self.data[base + i] += record[i]
+                self.data[base + self.WIDTH - 1] = record[-1]
+                return self.head
+        self.head = (self.head + 1) % self.slots
+        self.count = min(self.count + 1, self.slots)
+        self.data[self.head * self.WIDTH:(self.head + 1) * self.WIDTH] = array.array("d", record)
+        return self.head
+
+    def records(self):
+        """Records oldest first, as tuples of TREND_FIELDS."""
+        for n in range(self.count - 1, -1, -1):
+            base = (self.head - n) % self.slots * self.WIDTH
+            yield tuple(self.data[base:base + self.WIDTH])
+
+class TrendStore:
+    """Per-target time series of tick results, persisted to a fixed-size file.
+
+    Every target has a ring per TREND_RINGS entry: one slot per tick, plus
+    hourly and daily rollups. The file layout is fixed (header, then for each
+    target and ring its head/count and slots), so memory and disk use never
+    grow, and a tick only rewrites the slots it touched.
+
+    Ticks only update the rings in memory; a trend-writer thread writes the
+    touched slots to path, so a slow or offline log_dir never holds up a
+    tick. While path cannot be written the whole file is kept at spool_path
+    (local) and written back to path once it is reachable again.
+    """
+    HEADER = struct.Struct("<8sII")
+    RING_HEADER = struct.Struct("<qq")
+    MAGIC = b"RCTREND1"
+
+    def __init__(self, path, spool_path=None):
+        self.path = path
+        self.spool_path = spool_path
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._dirty = {}        # rip -> {ring name: slots not yet written}
+        self._rewrite = False   # path must be rewritten as a whole (after a failure)
+        self._closing = False
+        self._thread = None
+        self.rings = {rip: {name: TrendRing(slots, rollup) for name, slots, rollup in TREND_RINGS}
+                      for rip in VALID_RIPS}
+        self._offsets = {}
+        offset = self.HEADER.size
+        for rip in VALID_RIPS:
+            for name, slots, _rollup in TREND_RINGS:
+                self._offsets[(rip, name)] = offset
+                offset += self.RING_HEADER.size + 8 * slots * TrendRing.WIDTH
+        self.size = offset
+        self._file = None
+
+    def load(self):
+        """Read an existing file; returns False (and starts empty) when missing or incompatible.
+
+        A spooled copy newer than path wins; it is written back to path later.
+        """
+        raw = self._read(self.path)
+        spooled = self._read(self.spool_path) if self.spool_path else None
+        if spooled is not None and (raw is None or
+                                    os.path.getmtime(self.spool_path) >= os.path.getmtime(self.path)):
+            raw = spooled
+            self._rewrite = True
+        if raw is None:
+            return False
+        if len(raw) != self.size or self.HEADER.unpack_from(raw)[:2] != (self.MAGIC, 1):
+            return False
+        for (rip, name), offset in self._offsets.items():
+            ring = self.rings[rip][name]
+            ring.head, ring.count = self.RING_HEADER.unpack_from(raw, offset)
+            start = offset + self.RING_HEADER.size
+            ring.data = array.array("d", raw[start:start + 8 * ring.slots * TrendRing.WIDTH])
+        return True
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def record(self, result, backlog):
+        """Add a tick to the rings; the file is written by the trend-writer thread."""
+        values = (time.time(), 1, result.deleted, result.skipped, result.reclaimed,
+                  result.duration, backlog)
+        with self._lock:
+            rings = self.rings.get(result.rip_name)
+            if rings is None or self._closing:
+                return
+            dirty = self._dirty.setdefault(result.rip_name, {})
+            for name, ring in rings.items():
+                dirty.setdefault(name, set()).add(ring.add(values))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trend-writer", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def _run(self):
+        retry_at = None
+        while True:
+            with self._lock:
+                while not self._closing and (
+                        (not self._dirty and not self._rewrite) or retry_at is not None):
+                    timeout = None if retry_at is None else retry_at - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._wake.wait(timeout)
+                closing = self._closing
+                dirty, self._dirty = self._dirty, {}
+                rewrite = self._rewrite
+                # 書き込む内容はロック内で取り出し、ファイル I/O はロックの外で行う
+                if rewrite:
+                    chunks = self._image()
+                else:
+                    chunks = [chunk for rip, names in dirty.items()
+                              for name, slots in names.items()
+                              for chunk in self._ring_chunks(rip, name, slots)]
+            if rewrite or chunks:
                 try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Failed to delete old log: {filename} → {e}")
+                    self._write(chunks, rewrite)
+                except OSError as e:
+                    console.warning(f"Failed to write trend file '{self.path}': {e}")
+                    self._close()
+                    with self._lock:
+                        self._rewrite = True   # 復旧後はファイル全体を書き直す
+                        image = self._image()
+                    self._save_spool(image)
+                    retry_at = time.monotonic() + LOG_REPLAY_INTERVAL
+                else:
+                    with self._lock:
+                        if rewrite:
+                            self._rewrite = False
+                    if rewrite:
+                        self._remove_spool()
+                    retry_at = None
+            if closing:
+                return
+
+    def _ring_chunks(self, rip, name, slots=()):
+        """(offset, bytes) of a ring's head/count and the given slots."""
+        ring = self.rings[rip][name]
+        offset = self._offsets[(rip, name)]
+        yield offset, self.RING_HEADER.pack(ring.head, ring.count)
+        for slot in slots:
+            yield (offset + self.RING_HEADER.size + 8 * slot * TrendRing.WIDTH,
+                   ring.data[slot * TrendRing.WIDTH:(slot + 1) * TrendRing.WIDTH].tobytes())
+
+    def _image(self):
+        """The whole file as (offset, bytes) chunks."""
+        chunks = [(0, self.HEADER.pack(self.MAGIC, 1, TrendRing.WIDTH))]
+        for rip, name in self._offsets:
+            ring = self.rings[rip][name]
+            chunks.extend(self._ring_chunks(rip, name))
+            chunks.append((self._offsets[(rip, name)] + self.RING_HEADER.size, ring.data.tobytes()))
+        return chunks
+
+    def _write(self, chunks, rewrite=False):
+        if self._file is None:
+            if not rewrite and os.path.exists(self.path) and os.path.getsize(self.path) == self.size:
+                self._file = open(self.path, "r+b")
+            else:
+                self._file = open(self.path, "w+b")
+                if not rewrite:
+                    with self._lock:
+                        chunks = self._image()
+        for offset, data in chunks:
+            self._file.seek(offset)
+            self._file.write(data)
+        self._file.flush()
+
+    def _save_spool(self, chunks):
+        """Keep a local copy of the file while path cannot be written."""
+        if not self.spool_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+            temp_path = self.spool_path + ".tmp"
+            with open(temp_path, "wb") as f:
+                for offset, data in chunks:
+                    f.seek(offset)
+                    f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.spool_path)
+        except OSError as e:
+            console.warning(f"Failed to spool trend file to '{self.spool_path}': {e}")
+
+    def _remove_spool(self):
+        if self.spool_path:
+            try:
+                os.remove(self.spool_path)
+            except OSError:
+                pass
+
+    def close(self, timeout=LOG_SHUTDOWN_TIMEOUT):
+        """Write out pending records; spools them locally when path is not reachable in time."""
+        with self._lock:
+            self._closing = True
+            self._wake.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                with self._lock:
+                    image = self._image()
+                self._save_spool(image)
+                return
+        self._close()
+
+    def _close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+_trend_store = None
+
+def trend_spool_path(config):
+    spool_dir = config["General"].get("log_spool_dir", DEFAULT_LOG_SPOOL_DIR)
+    return os.path.join(get_app_dir(), spool_dir, TREND_FILE)
+
+def start_trend_store(config):
+    """Load (or create) the trend file in log_dir and record every tick into it."""
+    global _trend_store
+    log_dir = config["General"].get("log_dir", "")
+    store = TrendStore(os.path.join(log_dir, TREND_FILE), trend_spool_path(config))
+    try:
+        store.load()
+    except OSError as e:
+        console.warning(f"Failed to read trend file '{store.path}': {e}")
+    _trend_store = store
+    return store
+
+def parse_trend_args(argv):
+    parser = argparse.ArgumentParser(prog=APP_NAME, description="Show per-target trends.")
+    parser.add_argument("--trend", action="store_true", required=True)
+    parser.add_argument("--target", choices=VALID_RIPS, help="default: all targets")
+    parser.add_argument("--by", choices=[name for name, _slots, _rollup in TREND_RINGS], default="hour")
+    parser.add_argument("--last", type=int, default=24, help="number of periods to show (default: 24)")
+    return parser.parse_args(argv)
+
+def run_trend(config, argv):
+    """--trend: print the stored time series of one or all targets."""
+    args = parse_trend_args(argv)
+    store = TrendStore(os.path.join(config["General"].get("log_dir", ""), TREND_FILE),
+                       trend_spool_path(config))
+    if not store.load():
+        print(f"No trend data in '{store.path}'.")
+        return 1
+    fmt = {"tick": DETAILED_DATETIME_FORMAT, "hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d"}[args.by]
+    for rip in [args.target] if args.target else VALID_RIPS:
+        records = list(store.rings[rip][args.by].records())[-args.last:]
+        if not records:
+            continue
+        print(f"{rip} ({args.by}):")
+        print(f"  {'period':<19} {'ticks':>6} {'deleted':>8} {'skipped':>8} {'MB':>9} "
+              f"{'avg s':>7} {'backlog':>8}")
+        for stamp, ticks, deleted, skipped, reclaimed, duration, backlog in records:
+            print(f"  {datetime.fromtimestamp(stamp).strftime(fmt):<19} {ticks:>6.0f} {deleted:>8.0f} "
+                  f"{skipped:>8.0f} {reclaimed / 1e6:>9.2f} {duration / max(ticks, 1):>7.2f} "
+                  f"{backlog:>8.0f}")
+    return 0
+
+def flush_state():
+    """Write out buffered state before exiting: run logs, the trend file and the metrics file.
+
+    Run logs of ticks that have not finished are closed with a note first.
+    Log chunks that cannot reach log_dir in time are kept in the local spool.
+    """
+    close_open_run_logs("Run interrupted by shutdown before it finished.")
+    if _log_pipeline is not None:
+        _log_pipeline.close()
+    if _trend_store is not None:
+        _trend_store.close()
+    if _metrics_textfile:
+        try:
+            write_metrics_textfile(_metrics_textfile)
+        except OSError as e:
+            console.warning(f"Failed to write metrics file '{_metrics_textfile}': {e}")
 
 def disable_quick_edit():
     """Disable QuickEdit mode so console selection doesn't pause the process."""
@@ -310,28 +3990,61 @@ def disable_quick_edit():
         # 非Windows環境や失敗時は無視（安全側）
         pass
 
+def start_services(config):
+    """Start the log pipeline, retention, metrics, trend store and signal handling.
+
+    Called once this process holds the instance lock.
+    """
+    spool_dir = config.raw["General"].get("log_spool_dir", DEFAULT_LOG_SPOOL_DIR)
+    get_log_pipeline(os.path.join(get_app_dir(), spool_dir))
+    start_log_retention(config.raw)
+    start_metrics(config.raw)
+    start_trend_store(config.raw)
+    if config.raw["General"].getboolean("event_log", fallback=False):
+        _event_log_dirs.add(config.general.log_dir)
+    shutdown.install(config.general.drain_timeout)
+
 def main():
     disable_quick_edit()
     if len(sys.argv) >= 2 and sys.argv[1] == "--version":
         print(f"{APP_NAME} version {VERSION}")
         return
 
-    print(f"{APP_NAME} version {VERSION} started.")
-    
     config = load_config()
-    
-    # キックモードの処理
+    # ログ検索・集計（常駐処理は起動しない）
+    if len(sys.argv) >= 2 and sys.argv[1] in ("--query", "--stats"):
+        sys.exit(run_log_query(config.raw, sys.argv[1:]))
+    if len(sys.argv) >= 2 and sys.argv[1] == "--trend":
+        sys.exit(run_trend(config.raw, sys.argv[1:]))
+    console.level = CONSOLE_LEVELS.index(config.general.console_level)
+    console.summary(f"{APP_NAME} version {VERSION} started.")
+
+    # キックモードの処理（常駐中のインスタンスがあればそちらに依頼する）
     if len(sys.argv) >= 3 and sys.argv[1] == "--kick":
-        run_kick_mode(config, sys.argv[2])
+        return run_kick_mode(config, sys.argv[2])
+    # ロックを取れてから常駐用のスレッドやファイルを用意する
+    if not start_control(config.raw):
+        console.error(f"Another {APP_NAME} instance is already running in {get_app_dir()}.")
+        return 1
+    start_services(config)
+    # ウォッチモード（ディレクトリイベント駆動）
+    if len(sys.argv) >= 2 and sys.argv[1] == "--watch":
+        run_watch_mode(config)
     # ポーリングモード（デフォルト）
+    elif config.general.engine == "asyncio":
+        run_async_polling_mode(config)
     else:
         run_polling_mode(config)
+    flush_state()
+    if shutdown.requested.is_set():
+        console.summary(f"{APP_NAME} stopped after finishing running work.")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()   # --query / --stats の並列解析（PyInstaller 用）
     try:
-        main()
+        sys.exit(main())
     except Exception as e:
-        print(f"Unexpected error occurred: {e}")
+        console.error(f"Unexpected error occurred: {e}")
         sys.exit(1)
 
 
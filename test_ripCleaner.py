@@ -0,0 +1,316 @@
+"""Regression tests for ripCleaner (run with: python -m pytest -q)."""
+import asyncio
+import os
+import time
+
+import ripCleaner
+
+
+def test_async_kick_loop_drains_running_kicks(monkeypatch):
+    finished = []
+
+    async def slow_tick(config, rip_name, executor, concurrency, low_free_space=None):
+        await asyncio.sleep(0.3)
+        finished.append(rip_name)
+        return ripCleaner.TickResult(rip_name, "ok", deleted=1)
+
+    class Reloader:
+        config = None
+
+    monkeypatch.setattr(ripCleaner, "_async_tick", slow_tick)
+    monkeypatch.setattr(ripCleaner, "shutdown", ripCleaner.Shutdown())
+    monkeypatch.setattr(ripCleaner, "kicks", ripCleaner.KickQueue())
+
+    async def scenario():
+        locks = {rip: asyncio.Lock() for rip in ripCleaner.VALID_RIPS}
+        loop_task = asyncio.ensure_future(
+            ripCleaner._async_kick_loop(Reloader(), None, 1, locks))
+        kick = ripCleaner.kicks.request("RIP1")
+        await asyncio.sleep(ripCleaner.KICK_POLL_INTERVAL * 2)   # kick has started
+        ripCleaner.shutdown.requested.set()
+        started = time.monotonic()
+        await loop_task
+        return kick, time.monotonic() - started
+
+    kick, waited = asyncio.run(scenario())
+    assert finished == ["RIP1"]
+    assert kick.result(timeout=0).status == "ok"
+    assert waited > 0.05
+
+
+def test_log_retention_buckets_with_trailing_separator(tmp_path):
+    log_dir = str(tmp_path) + os.sep
+    retention = ripCleaner.LogRetention(log_dir, day_buckets=True)
+    retention.note(retention.path_for("20240101_120000_RIP1.log"))
+    retention.note(os.path.join(log_dir, "20240101_130000_RIP2.log"))
+    expire = sorted((path, is_bucket) for _ends, path, is_bucket in retention._expire)
+    assert expire == [(os.path.join(str(tmp_path), "20240101"), True),
+                      (os.path.join(str(tmp_path), "20240101_130000_RIP2.log"), False)]
+
+
+def test_policy_keeps_backreferences_and_global_flags():
+    policy = ripCleaner.Policy([
+        ripCleaner.PolicyRule("keep", r"(?i)KEEP_.*\.tif", action="ignore"),
+        ripCleaner.PolicyRule("twice", r"(x+)\1\.dat"),
+        ripCleaner.BUILTIN_RULE,
+    ])
+    assert policy.match("keep_bip0-output-1bpp-1.tif") is None
+    assert policy.match("xxxx.dat").name == "twice"
+    assert policy.match("xxx.dat") is None
+    assert policy.match("bip0-output-1bpp-1.tif") is ripCleaner.BUILTIN_RULE
+
+
+def test_policy_names_rule_with_invalid_pattern():
+    try:
+        ripCleaner.Policy([ripCleaner.PolicyRule("broken", "(")])
+    except ValueError as e:
+        assert "broken" in str(e)
+    else:
+        raise AssertionError("ValueError not raised")
+
+
+def test_standalone_kick_keeps_instance_lock(monkeypatch, tmp_path):
+    monkeypatch.setattr(ripCleaner, "get_app_dir", lambda: str(tmp_path))
+    monkeypatch.setattr(ripCleaner, "_instance_lock", None)
+    assert ripCleaner.request_kick("RIP1") is None
+    try:
+        daemon = ripCleaner.InstanceLock(str(tmp_path / ripCleaner.INSTANCE_LOCK_FILE))
+        assert not daemon.acquire()
+    finally:
+        ripCleaner._instance_lock.release()
+
+
+def test_trend_store_spools_while_log_dir_is_unreachable(tmp_path):
+    path = str(tmp_path / "offline" / ripCleaner.TREND_FILE)
+    spool_path = str(tmp_path / "spool" / ripCleaner.TREND_FILE)
+    result = ripCleaner.TickResult("RIP1", "ok", deleted=3)
+    store = ripCleaner.TrendStore(path, spool_path)
+    store.record(result, 0)
+    store.close()
+    assert not os.path.exists(path)
+    assert os.path.getsize(spool_path) == store.size
+
+    os.mkdir(tmp_path / "offline")
+    store = ripCleaner.TrendStore(path, spool_path)
+    assert store.load()
+    store.record(result, 0)
+    store.close()
+    assert not os.path.exists(spool_path)
+    reloaded = ripCleaner.TrendStore(path)
+    assert reloaded.load()
+    assert [r[2] for r in reloaded.rings["RIP1"]["tick"].records()] == [3, 3]
+
+
+def test_reload_keeps_startup_log_dir(tmp_path, monkeypatch):
+    config_file = tmp_path / "config.ini"
+    text = "[General]\npolling_interval = 1\nlog_dir = {}\n\n[RIP1]\npath = {}\n"
+    config_file.write_text(text.format(tmp_path / "logs", tmp_path / "RIP1"))
+    reloader = ripCleaner.ConfigReloader(ripCleaner.load_config(str(config_file)), str(config_file))
+    config_file.write_text(text.format(tmp_path / "other", tmp_path / "RIP1") + "\n")
+    monkeypatch.setattr(ripCleaner, "CONFIG_WATCH_INTERVAL", 0)
+    for _ in range(2):   # the change is picked up once the file has stayed the same
+        reloader._next_check = 0
+        reloader.check()
+    assert reloader.config.raw["General"]["log_dir"] == str(tmp_path / "other")
+    assert reloader.config.general.log_dir == str(tmp_path / "logs")
+
+
+def test_low_free_space_cleanup_is_recorded_in_run_log(tmp_path):
+    rip_dir = tmp_path / "RIP1"
+    log_dir = tmp_path / "logs"
+    rip_dir.mkdir()
+    log_dir.mkdir()
+    name = "bip0-output-1bpp-1.tif"
+    (rip_dir / name).write_bytes(b"x" * 2048)
+    os.utime(rip_dir / name, (time.time() - 3600, time.time() - 3600))
+    low = ripCleaner.LowFreeSpace(free=100e6, limit=500e6)
+    result = ripCleaner.delete_matching_files("RIP1", str(rip_dir), str(log_dir),
+                                              low_free_space=low)
+    ripCleaner.get_log_pipeline().flush()
+    assert (result.deleted, result.skipped) == (1, 0)
+    logs = list(log_dir.rglob("*.log"))
+    text = "".join(path.read_text(encoding="utf-8") for path in logs)
+    assert "<LOW_FREE_SPACE>" in text
+    assert "Free space 100 MB was below 500 MB; reclaimed 0.0 MB" in text
+    statuses = [status for path in logs
+                for _run, _target, events in ripCleaner.parse_log_source(str(path))[1]
+                for _ts, _file, status, _reason in events]
+    assert sorted(statuses) == ["deleted", "note"]
+
+
+def test_call_guard_reports_finished_calls_on_timeout():
+    guard = ripCleaner.CallGuard("RIP1", timeout=0.2, concurrency=4)
+    executed = []
+
+    def remove(item):
+        time.sleep(1.0 if item == 0 else 0.01)
+        executed.append(item)
+        return item
+
+    reported = []
+    try:
+        for item, result in guard.run_each(remove, range(4)):
+            reported.append(result)
+    except TimeoutError:
+        pass
+    else:
+        raise AssertionError("TimeoutError not raised")
+    finally:
+        guard.shutdown()
+    assert sorted(reported) == sorted(executed) == [1, 2, 3]
+
+
+def test_standalone_kick_writes_trend_before_exit(monkeypatch, tmp_path):
+    path = str(tmp_path / ripCleaner.TREND_FILE)
+    store = ripCleaner.TrendStore(path)
+
+    def start_services(config):
+        ripCleaner._trend_store = store
+
+    def run_for_rip(config, rip_name):
+        store.record(ripCleaner.TickResult(rip_name, "ok", deleted=1), 0)
+
+    monkeypatch.setattr(ripCleaner, "request_kick", lambda target: None)
+    monkeypatch.setattr(ripCleaner, "start_services", start_services)
+    monkeypatch.setattr(ripCleaner, "run_for_rip", run_for_rip)
+    monkeypatch.setattr(ripCleaner, "_trend_store", None)
+    monkeypatch.setattr(ripCleaner, "_log_pipeline", None)
+    ripCleaner.run_kick_mode(None, "RIP1")
+    reloaded = ripCleaner.TrendStore(path)
+    assert reloaded.load()
+    assert len(list(reloaded.rings["RIP1"]["tick"].records())) == 1
+
+
+def test_log_retention_note_does_not_wait_for_rescan(monkeypatch, tmp_path):
+    import threading
+    retention = ripCleaner.LogRetention(str(tmp_path))
+    stamp = ripCleaner.datetime.now().strftime(ripCleaner.LOG_DATETIME_FORMAT)
+    noted = retention.path_for(f"{stamp}_RIP1.log")
+    real_scandir = os.scandir
+    finished = []
+
+    def slow_scandir(path):
+        # a tick writes its first log record while the share is being listed
+        thread = threading.Thread(target=lambda: (retention.note(noted), finished.append(1)))
+        thread.start()
+        thread.join(1.0)
+        return real_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", slow_scandir)
+    retention.run_once()
+    assert finished == [1]
+    assert noted in retention._known
+
+
+def test_reload_applies_overrun_policy(tmp_path, monkeypatch, capsys):
+    config_file = tmp_path / "config.ini"
+    text = "[General]\npolling_interval = 1\nlog_dir = {}\n{}\n[RIP1]\npath = {}\n"
+    config_file.write_text(text.format(tmp_path / "logs", "", tmp_path / "RIP1"))
+    config = ripCleaner.load_config(str(config_file))
+    reloader = ripCleaner.ConfigReloader(config, str(config_file))
+    schedules = ripCleaner.create_schedules(config)
+    config_file.write_text(text.format(tmp_path / "logs",
+                                       "overrun_policy = catch_up\nasync_concurrency = 2\n",
+                                       tmp_path / "RIP1"))
+    monkeypatch.setattr(ripCleaner, "CONFIG_WATCH_INTERVAL", 0)
+    for _ in range(2):
+        reloader._next_check = 0
+        ripCleaner.apply_reload(reloader, schedules)
+    assert {schedule.policy for schedule in schedules.values()} == {"catch_up"}
+    assert "async_concurrency take effect after a restart" in capsys.readouterr().out
+
+
+def test_async_delete_records_files_in_flight_when_one_times_out(monkeypatch, tmp_path):
+    rip_dir = tmp_path / "RIP1"
+    log_dir = tmp_path / "logs"
+    rip_dir.mkdir()
+    names = [f"bip0-output-1bpp-{page}.tif" for page in range(1, 5)]
+    for name in names:
+        (rip_dir / name).write_bytes(b"x" * 16)
+    real_clean = ripCleaner.clean_entry_counted
+
+    def clean(rip_name, entry, *args):
+        if entry.name == names[0]:
+            raise TimeoutError("remove did not finish within 1s")
+        time.sleep(0.2)
+        return real_clean(rip_name, entry, *args)
+
+    monkeypatch.setattr(ripCleaner, "clean_entry_counted", clean)
+    result = ripCleaner.async_clean_once("RIP1", str(rip_dir), str(log_dir), concurrency=4)
+    assert result.status == "access_error"
+    assert result.deleted == 3
+    assert sorted(os.listdir(rip_dir)) == [names[0]]
+
+
+def test_enumeration_seconds_covers_the_whole_listing(monkeypatch, tmp_path):
+    def slow_listing():
+        time.sleep(0.2)   # a lazy listing reads the share while it is iterated
+        yield from ()
+
+    observed = []
+    monkeypatch.setattr(ripCleaner, "open_scan", lambda *args: (slow_listing(), True))
+    monkeypatch.setattr(ripCleaner.metrics, "observe",
+                        lambda name, target, seconds: observed.append((name, seconds)))
+    ripCleaner.delete_matching_files("RIP1", str(tmp_path), str(tmp_path / "logs"))
+    assert [seconds for name, seconds in observed if name == "enumeration_seconds"][0] >= 0.2
+
+
+def test_pending_file_is_deleted_when_folder_is_unchanged(tmp_path):
+    rip_dir = tmp_path / "RIP1"
+    log_dir = tmp_path / "logs"
+    rip_dir.mkdir()
+    name = "bip0-output-1bpp-1.tif"
+    (rip_dir / name).write_bytes(b"")            # still being written by the RIP
+    (rip_dir / "preview-1.png").write_bytes(b"x")
+    snapshot = ripCleaner.DirectorySnapshot()
+
+    first = ripCleaner.delete_matching_files("RIP1", str(rip_dir), str(log_dir), snapshot=snapshot)
+    assert (first.deleted, first.skipped) == (0, 1)
+    assert snapshot.pending == {name}
+    assert "preview-1.png" in snapshot.ignored
+
+    # Writing into the file does not change the folder, so it is not listed again;
+    # the pending name is still checked and deleted.
+    folder_key = snapshot.dir_key
+    (rip_dir / name).write_bytes(b"x" * 16)
+    io_counts = ripCleaner.Counter()
+    entries, listed = ripCleaner.iter_snapshot_entries(str(rip_dir), io_counts, snapshot)
+    assert not listed
+    assert [entry.name for entry in entries] == [name]
+    snapshot.pending.add(name)   # put back for the real tick below
+
+    second = ripCleaner.delete_matching_files("RIP1", str(rip_dir), str(log_dir), snapshot=snapshot)
+    assert (second.deleted, second.skipped) == (1, 0)
+    assert not (rip_dir / name).exists()
+    assert snapshot.pending == set()
+    assert snapshot.dir_key == folder_key
+
+
+def test_retry_queue_backs_off_and_prunes(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(ripCleaner.time, "monotonic", lambda: clock[0])
+    queue = ripCleaner.RetryQueue(base_delay=1, max_delay=4)
+    assert [queue.schedule("a.tif") for _ in range(4)] == [(1, 1), (2, 2), (3, 4), (4, 4)]
+    assert queue.is_waiting("a.tif")
+    clock[0] += 4
+    assert not queue.is_waiting("a.tif")
+    queue.prune()
+    assert len(queue) == 1              # due, but not yet for longer than max_delay
+    clock[0] += 4
+    queue.prune()
+    assert len(queue) == 0              # never seen again: forgotten
+    queue.schedule("b.tif")
+    queue.discard("b.tif")
+    assert not queue.is_waiting("b.tif")
+
+
+def test_target_schedule_overrun_policies():
+    def overrun(policy, late):
+        schedule = ripCleaner.TargetSchedule("RIP1", policy, now=0.0)
+        assert schedule.complete(1, finished=10.0) == 60.0   # on time: next slot on the grid
+        return schedule.complete(1, finished=60.0 + late)
+
+    assert overrun("skip", 150.0) == 240.0       # slots at 120 and 180 dropped
+    assert overrun("catch_up", 150.0) == 120.0   # missed slots run back to back
+    assert overrun("catch_up", 300.0) == 60.0 + (5 + 1 - ripCleaner.CATCH_UP_MAX_SLOTS) * 60
+    assert overrun("coalesce", 150.0) == 210.0   # one tick now, grid restarts there